@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -19,7 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'trading',
+    'trading.apps.TradingConfig',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -31,6 +32,8 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'trading.instrumentation.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -68,6 +71,8 @@ DATABASES = {
         }
     }
 }
+# Reports run as native aggregation pipelines on MongoDB (trading.aggregations); "0" falls back to the ORM
+REPORTS_NATIVE_PIPELINES = os.getenv("REPORTS_NATIVE_PIPELINES", "1") == "1"
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -82,10 +87,23 @@ USE_I18N = True
 USE_TZ = True
 
 STATIC_URL = '/static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# ✅ Static & media serving — run `collectstatic` and, after `npm run build`, `compress_frontend`
+# collectstatic writes content-hashed names plus .gz/.br copies; WhiteNoise serves them with far-future caching
+STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Built Vite bundle, served from the site root (its /assets/ files carry Vite's content hash)
+FRONTEND_DIST_DIR = Path(os.getenv("FRONTEND_DIST_DIR", BASE_DIR.parent / 'marketplace-frontend' / 'dist'))
+WHITENOISE_ROOT = FRONTEND_DIST_DIR if FRONTEND_DIST_DIR.is_dir() else None
+WHITENOISE_INDEX_FILE = True
+WHITENOISE_IMMUTABLE_FILE_TEST = r'^/(static/.+\.[0-9a-f]{12}|assets/.+-[\w-]{8})\.\w+$'
+# Media goes through trading.media.serve_media (conditional GETs + byte ranges)
+SERVE_MEDIA = os.getenv("SERVE_MEDIA", "1") == "1"
+MEDIA_CACHE_MAX_AGE = 24 * 60 * 60  # uploads; generated variants are content-hashed and immutable
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # ✅ CORS for React frontend
@@ -96,13 +114,26 @@ CORS_ALLOWED_ORIGINS = [
 # ✅ Django REST Framework Authentication
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'trading.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',  # 👈 Changed from AllowAny to secure views like /my-orders/
     ],
 }
 
+# ✅ Optional JWT mode — Bearer access tokens verified without a DB query, alongside Djoser's tokens
+JWT_AUTH_ENABLED = os.getenv("JWT_AUTH_ENABLED") == "1"
+if JWT_AUTH_ENABLED:
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'].insert(0, 'trading.jwt_auth.StatelessJWTAuthentication')
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'ROTATE_REFRESH_TOKENS': True,
+    'BLACKLIST_AFTER_ROTATION': False,  # revoked tokens live in the cache below, not in blacklist tables
+    'AUTH_HEADER_TYPES': ('Bearer',),
+}
+JWT_REVOCATION_CACHE_ALIAS = 'default'  # must be shared (Redis) across workers; see trading.W002
+
 # ✅ Djoser configuration
 DJOSER = {
     "PASSWORD_RESET_CONFIRM_URL": "reset-password/{uid}/{token}/",
@@ -117,24 +148,93 @@ DJOSER = {
 }
 
 # ✅ Email backend
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Mail is queued in the database and sent by `python manage.py run_mail_worker`
+EMAIL_BACKEND = 'trading.mail.QueuedEmailBackend'
+MAIL_QUEUE_DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+MAIL_QUEUE_MAX_ATTEMPTS = 6
+MAIL_QUEUE_RETRY_BASE_DELAY = 30  # seconds, doubled on every retry
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 
+# ✅ M-Pesa (Daraja) — run `python manage.py fake_daraja` and point MPESA_BASE_URL at it for local testing
+MPESA_BASE_URL = os.getenv("MPESA_BASE_URL", "https://sandbox.safaricom.co.ke")
+MPESA_CONSUMER_KEY = os.getenv("MPESA_CONSUMER_KEY", "1DEEHZLVet8rk48sceBOq2KmKfLkvGKwQlE6rhUgk9nxBM24")
+MPESA_CONSUMER_SECRET = os.getenv("MPESA_CONSUMER_SECRET", "3CM38AMKIlDAWTTsKj9OR4juPJ7xaXQas55Uc1YmNmPnqSWUMvqe4TnkP2cj6mh9")
+MPESA_SHORTCODE = os.getenv("MPESA_SHORTCODE", "174379")
+MPESA_PASSKEY = os.getenv("MPESA_PASSKEY", "bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919")
+MPESA_CALLBACK_URL = os.getenv("MPESA_CALLBACK_URL", "https://example.com/api/mpesa/callback/")
+# Appended to the callback URL as ?token=...; callbacks without it are rejected unless DEBUG
+MPESA_CALLBACK_SECRET = os.getenv("MPESA_CALLBACK_SECRET", "")
+# Optional comma-separated list of addresses callbacks may come from
+MPESA_CALLBACK_IPS = [ip.strip() for ip in os.getenv("MPESA_CALLBACK_IPS", "").split(",") if ip.strip()]
+MPESA_CONNECT_TIMEOUT = float(os.getenv("MPESA_CONNECT_TIMEOUT", "3.05"))
+MPESA_READ_TIMEOUT = float(os.getenv("MPESA_READ_TIMEOUT", "15"))
+# Tax shown on cart totals (trading.cart); 0 while checkout charges listed prices as-is
+CART_TAX_RATE = os.getenv("CART_TAX_RATE", "0")
+# Seconds stock stays reserved for an unpaid checkout (see `manage.py release_expired_holds`)
+STOCK_HOLD_TTL = 15 * 60
+# Seconds before an idempotency key whose checkout never produced an order (crashed request) is freed
+CHECKOUT_KEY_TIMEOUT = 10 * 60
+
+# ✅ Cache (public catalog responses) — local memory unless REDIS_URL is set
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient'},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300  # seconds
+# Token -> user lookups (trading.authentication.CachedTokenAuthentication)
+AUTH_TOKEN_CACHE_ALIAS = 'default'
+AUTH_TOKEN_CACHE_TIMEOUT = 60  # seconds in the shared cache
+AUTH_TOKEN_LOCAL_TIMEOUT = 5  # seconds in each process; not cleared by other processes' invalidations
+
 # ✅ Frontend base (for custom emails or redirects)
 FRONTEND_BASE_URL = os.getenv("FRONTEND_BASE_URL", "http://localhost:5173")
 
-# ✅ Basic logging
+# ✅ Request metrics — DB round trips, DB/serialize/render time and size per request (trading.instrumentation)
+REQUEST_METRICS_ENABLED = os.getenv("REQUEST_METRICS_ENABLED", "1") == "1"
+REQUEST_METRICS_SAMPLE_RATE = float(os.getenv("REQUEST_METRICS_SAMPLE_RATE", "0.05"))  # share of requests logged
+REQUEST_METRICS_SLOW_MS = float(os.getenv("REQUEST_METRICS_SLOW_MS", "500"))  # always logged above this
+REQUEST_METRICS_SERVER_TIMING = os.getenv("REQUEST_METRICS_SERVER_TIMING", "1" if DEBUG else "0") == "1"
+
+# ✅ Basic logging, plus one JSON line per sampled or slow request
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'trading.instrumentation.JSONFormatter',
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        'metrics': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'trading.metrics': {
+            'handlers': ['metrics'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
     'root': {
         'handlers': ['console'],
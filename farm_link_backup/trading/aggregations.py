@@ -0,0 +1,263 @@
+"""
+Report queries as hand-written MongoDB aggregation pipelines.
+
+djongo runs every ORM query through its SQL-to-Mongo translator, and joins
+with a GROUP BY over orders, items and products come back row by row for
+Python to add up. The reports here are written as ``$match`` / ``$lookup`` /
+``$group`` pipelines and sent straight to pymongo, so the server does the
+joining and summing and only the totals cross the wire.
+
+Every report also has an ORM version. It is used when the database isn't
+MongoDB or ``REPORTS_NATIVE_PIPELINES`` is off. ``NativePipelineTests`` in
+``trading/tests.py`` checks on MongoDB that both return the same rows, and
+``manage.py compare_report_pipelines`` times them.
+
+A line is priced at its recorded ``unit_price``, or at the product's current
+price for orders placed before unit prices were recorded. Revenue reports
+leave out cancelled orders; order totals include every order.
+"""
+import datetime
+from decimal import Decimal
+
+from bson.decimal128 import Decimal128
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Category, Order, OrderItem, Product
+from .reports import REPORT_CHUNK_SIZE
+
+CENTS = Decimal('0.01')
+
+LINE_TOTAL = ExpressionWrapper(
+    F('quantity') * Coalesce('unit_price', 'product__price'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+def native_enabled(using='default'):
+    return getattr(settings, 'REPORTS_NATIVE_PIPELINES', True) and connections[using].vendor == 'djongo'
+
+
+def database(using='default'):
+    """The pymongo database behind djongo's own connection."""
+    connection = connections[using]
+    connection.ensure_connection()
+    return connection.connection
+
+
+def collection(model, using='default'):
+    return database(using)[model._meta.db_table]
+
+
+def money(value):
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    return Decimal(str(value or 0)).quantize(CENTS)
+
+
+def aware(value):
+    # pymongo hands back naive UTC datetimes
+    if value is not None and settings.USE_TZ and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def pick(native, using):
+    return native_enabled(using) if native is None else native
+
+
+# ==================== PIPELINE STAGES ====================
+def order_match(start=None, end=None, status=None, exclude_cancelled=False):
+    match = {}
+    if start is not None or end is not None:
+        match['created_at'] = {}
+        if start is not None:
+            match['created_at']['$gte'] = start
+        if end is not None:
+            match['created_at']['$lt'] = end
+    if status is not None:
+        match['status'] = status
+    elif exclude_cancelled:
+        match['status'] = {'$ne': 'cancelled'}
+    return [{'$match': match}] if match else []
+
+
+def line_stages():
+    """Join each order to its items and their products and price every line as ``line_total``."""
+    return [
+        {'$lookup': {
+            'from': OrderItem._meta.db_table, 'localField': 'id', 'foreignField': 'order_id', 'as': 'item',
+        }},
+        {'$unwind': '$item'},
+        {'$lookup': {
+            'from': Product._meta.db_table, 'localField': 'item.product_id', 'foreignField': 'id', 'as': 'product',
+        }},
+        {'$unwind': '$product'},
+        {'$addFields': {'line_total': {
+            '$multiply': ['$item.quantity', {'$ifNull': ['$item.unit_price', '$product.price']}],
+        }}},
+    ]
+
+
+def sales_group(key, **extra):
+    return {'$group': {
+        '_id': key,
+        'order_ids': {'$addToSet': '$id'},
+        'units': {'$sum': '$item.quantity'},
+        'revenue': {'$sum': '$line_total'},
+        **extra,
+    }}
+
+
+def aggregate(model, pipeline, using='default'):
+    return collection(model, using).aggregate(pipeline, allowDiskUse=True, batchSize=REPORT_CHUNK_SIZE)
+
+
+def order_q(start=None, end=None, status=None, exclude_cancelled=False, prefix=''):
+    """The ORM counterpart of :func:`order_match`, with lookups relative to ``prefix``."""
+    q = Q()
+    if start is not None:
+        q &= Q(**{prefix + 'created_at__gte': start})
+    if end is not None:
+        q &= Q(**{prefix + 'created_at__lt': end})
+    if status is not None:
+        q &= Q(**{prefix + 'status': status})
+    elif exclude_cancelled:
+        q &= ~Q(**{prefix + 'status': 'cancelled'})
+    return q
+
+
+# ==================== ORDER TOTALS ====================
+def order_totals(start=None, end=None, status=None, native=None, using='default'):
+    """
+    Yield ``(id, created_at, customer_name, total, status)`` for each order, by id.
+
+    Rows stream from a cursor, so memory stays flat on large exports.
+    """
+    if not pick(native, using):
+        rows = (
+            Order.objects.using(using).filter(order_q(start, end, status)).with_totals()
+            .order_by('id')
+            .values_list('id', 'created_at', 'customer_name', 'total', 'status')
+            .iterator(chunk_size=REPORT_CHUNK_SIZE)
+        )
+        for order_id, created_at, customer_name, total, order_status in rows:
+            yield order_id, created_at, customer_name, money(total), order_status
+        return
+
+    # No $group: orders are walked in id order and each one totals its own lines,
+    # so the first rows reach the CSV while later orders are still being read
+    pipeline = [
+        *order_match(start, end, status),
+        {'$sort': {'id': 1}},
+        {'$lookup': {
+            'from': OrderItem._meta.db_table,
+            'let': {'order_id': '$id'},
+            'pipeline': [
+                {'$match': {'$expr': {'$eq': ['$order_id', '$$order_id']}}},
+                {'$lookup': {
+                    'from': Product._meta.db_table, 'localField': 'product_id', 'foreignField': 'id', 'as': 'product',
+                }},
+                {'$project': {'_id': 0, 'line_total': {'$multiply': [
+                    '$quantity', {'$ifNull': ['$unit_price', {'$arrayElemAt': ['$product.price', 0]}]},
+                ]}}},
+            ],
+            'as': 'lines',
+        }},
+        {'$project': {
+            '_id': 0, 'id': 1, 'created_at': 1, 'customer_name': 1, 'status': 1, 'total': {'$sum': '$lines.line_total'},
+        }},
+    ]
+    for row in aggregate(Order, pipeline, using):
+        yield row['id'], aware(row['created_at']), row['customer_name'], money(row['total']), row['status']
+
+
+# ==================== REVENUE BY CATEGORY ====================
+def revenue_by_category(start=None, end=None, native=None, using='default'):
+    """Orders, units and revenue per category, highest revenue first."""
+    if not pick(native, using):
+        rows = (
+            OrderItem.objects.using(using)
+            .filter(order_q(start, end, exclude_cancelled=True, prefix='order__'))
+            .values('product__category_id', 'product__category__name')
+            .annotate(orders=Count('order_id', distinct=True), units=Sum('quantity'), revenue=Sum(LINE_TOTAL))
+            .order_by('-revenue', 'product__category_id')
+        )
+        return [
+            {
+                'category_id': row['product__category_id'],
+                'category': row['product__category__name'],
+                'orders': row['orders'],
+                'units': row['units'],
+                'revenue': money(row['revenue']),
+            }
+            for row in rows
+        ]
+
+    pipeline = [
+        *order_match(start, end, exclude_cancelled=True),
+        *line_stages(),
+        sales_group('$product.category_id'),
+        {'$lookup': {'from': Category._meta.db_table, 'localField': '_id', 'foreignField': 'id', 'as': 'category'}},
+        {'$project': {
+            'category': {'$arrayElemAt': ['$category.name', 0]},
+            'orders': {'$size': '$order_ids'},
+            'units': 1,
+            'revenue': 1,
+        }},
+        {'$sort': {'revenue': -1, '_id': 1}},
+    ]
+    return [
+        {
+            'category_id': row['_id'],
+            'category': row.get('category'),
+            'orders': row['orders'],
+            'units': row['units'],
+            'revenue': money(row['revenue']),
+        }
+        for row in aggregate(Order, pipeline, using)
+    ]
+
+
+# ==================== TOP SELLERS ====================
+def top_sellers(limit=10, start=None, end=None, native=None, using='default'):
+    """The ``limit`` products with the most units sold, ties broken by revenue."""
+    if not pick(native, using):
+        rows = (
+            OrderItem.objects.using(using)
+            .filter(order_q(start, end, exclude_cancelled=True, prefix='order__'))
+            .values('product_id', 'product__name')
+            .annotate(orders=Count('order_id', distinct=True), units=Sum('quantity'), revenue=Sum(LINE_TOTAL))
+            .order_by('-units', '-revenue', 'product_id')[:limit]
+        )
+        return [
+            {
+                'product_id': row['product_id'],
+                'name': row['product__name'],
+                'orders': row['orders'],
+                'units': row['units'],
+                'revenue': money(row['revenue']),
+            }
+            for row in rows
+        ]
+
+    pipeline = [
+        *order_match(start, end, exclude_cancelled=True),
+        *line_stages(),
+        sales_group('$item.product_id', name={'$first': '$product.name'}),
+        {'$project': {'name': 1, 'orders': {'$size': '$order_ids'}, 'units': 1, 'revenue': 1}},
+        {'$sort': {'units': -1, 'revenue': -1, '_id': 1}},
+        {'$limit': limit},
+    ]
+    return [
+        {
+            'product_id': row['_id'],
+            'name': row['name'],
+            'orders': row['orders'],
+            'units': row['units'],
+            'revenue': money(row['revenue']),
+        }
+        for row in aggregate(Order, pipeline, using)
+    ]
@@ -0,0 +1,193 @@
+"""
+Pre-aggregated sales rollups for the analytics dashboard.
+
+Placing an order adds its orders/units/revenue to one ``SalesRollup`` row per
+granularity (hour and day) for the shop total, each category and each
+product in it. Cancelling the order subtracts the same amounts again, using
+the prices recorded on its items. A trend query reads one row per bucket in
+the requested range, so its cost depends on the range and the granularity,
+never on how many orders exist. ``rebuild_sales_rollups`` (run by
+``manage.py backfill_sales_rollups``) recomputes everything from the orders.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import OrderItem, SalesRollup
+
+GRANULARITIES = ('hour', 'day')
+ZERO = Decimal('0.00')
+
+
+def bucket_start(moment, granularity):
+    moment = moment.astimezone(datetime.timezone.utc)
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def order_deltas(created_at, lines, deltas=None):
+    """
+    Add one order to ``deltas``: ``{(granularity, scope, key, bucket): [orders, units, revenue]}``.
+
+    ``lines`` are ``(product_id, category_id, quantity, unit_price)``. Each
+    scope counts the order once however many of its lines fall in it.
+    """
+    deltas = {} if deltas is None else deltas
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(created_at, granularity)
+        counted = set()
+        for product_id, category_id, quantity, unit_price in lines:
+            revenue = (unit_price or ZERO) * quantity
+            for scope, key in (('total', 0), ('category', category_id), ('product', product_id)):
+                row = deltas.setdefault((granularity, scope, key, bucket), [0, 0, ZERO])
+                if (scope, key) not in counted:
+                    counted.add((scope, key))
+                    row[0] += 1
+                row[1] += quantity
+                row[2] += revenue
+    return deltas
+
+
+def apply_deltas(deltas, sign=1):
+    for (granularity, scope, key, bucket), (orders, units, revenue) in deltas.items():
+        lookup = {'granularity': granularity, 'scope': scope, 'key': key, 'bucket': bucket}
+        changes = {
+            'orders': F('orders') + sign * orders,
+            'units': F('units') + sign * units,
+            'revenue': F('revenue') + sign * revenue,
+        }
+        if SalesRollup.objects.filter(**lookup).update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                SalesRollup.objects.create(**lookup, orders=sign * orders, units=sign * units, revenue=sign * revenue)
+        except IntegrityError:
+            # Another order created the bucket first
+            SalesRollup.objects.filter(**lookup).update(**changes)
+
+
+def record_order(order, items):
+    """Count a just-placed order; ``items`` are validated ``{'product': Product, 'quantity': int}`` lines."""
+    lines = [
+        (item['product'].pk, item['product'].category_id, item['quantity'], item['product'].price)
+        for item in items
+    ]
+    apply_deltas(order_deltas(order.created_at, lines))
+
+
+def order_lines(order_id):
+    items = OrderItem.objects.filter(order_id=order_id).values_list(
+        'order__created_at', 'product_id', 'product__category_id', 'quantity', 'unit_price', 'product__price',
+    )
+    created_at, lines = None, []
+    for created_at, product_id, category_id, quantity, unit_price, price in items:
+        lines.append((product_id, category_id, quantity, unit_price if unit_price is not None else price))
+    return created_at, lines
+
+
+def record_cancellation(order_id, sign=-1):
+    """Take a cancelled order back out of the rollups (``sign=1`` puts a reinstated one back)."""
+    created_at, lines = order_lines(order_id)
+    if lines:
+        apply_deltas(order_deltas(created_at, lines), sign)
+
+
+def rebuild_sales_rollups(batch_size=2000):
+    """Recompute every rollup from non-cancelled orders; returns ``(orders, rows)``."""
+    items = (
+        OrderItem.objects.exclude(order__status='cancelled')
+        .order_by('order_id')
+        .values_list(
+            'order_id', 'order__created_at', 'product_id', 'product__category_id',
+            'quantity', 'unit_price', 'product__price',
+        )
+        .iterator(chunk_size=batch_size)
+    )
+    deltas = {}
+    orders = 0
+    current, created_at, lines = None, None, []
+    for order_id, order_created, product_id, category_id, quantity, unit_price, price in items:
+        if order_id != current:
+            if lines:
+                order_deltas(created_at, lines, deltas)
+                orders += 1
+            current, created_at, lines = order_id, order_created, []
+        lines.append((product_id, category_id, quantity, unit_price if unit_price is not None else price))
+    if lines:
+        order_deltas(created_at, lines, deltas)
+        orders += 1
+
+    with transaction.atomic():
+        SalesRollup.objects.all().delete()
+        SalesRollup.objects.bulk_create(
+            (
+                SalesRollup(granularity=granularity, scope=scope, key=key, bucket=bucket,
+                            orders=values[0], units=values[1], revenue=values[2])
+                for (granularity, scope, key, bucket), values in deltas.items()
+            ),
+            batch_size=batch_size,
+        )
+    return orders, len(deltas)
+
+
+# ==================== TREND QUERIES ====================
+def period_start(moment, granularity):
+    if granularity == 'month':
+        return bucket_start(moment, 'day').replace(day=1)
+    return bucket_start(moment, granularity)
+
+
+def next_period(moment, granularity):
+    if granularity == 'hour':
+        return moment + datetime.timedelta(hours=1)
+    if granularity == 'day':
+        return moment + datetime.timedelta(days=1)
+    return (moment.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def period_label(moment, granularity):
+    if granularity == 'hour':
+        return moment.strftime('%Y-%m-%dT%H:00Z')
+    if granularity == 'day':
+        return moment.strftime('%Y-%m-%d')
+    return moment.strftime('%Y-%m')
+
+
+def sales_trends(granularity, start, end, scope='total', key=0):
+    """
+    One point per period in ``[start, end)``, empty periods included.
+
+    ``start`` is moved back to the beginning of its period, so the first
+    point covers a whole hour, day or month like the others; only the
+    current period can be partial. Months are summed from the day rollups,
+    so a query reads at most one row per hour or day in the range.
+    """
+    source = 'day' if granularity == 'month' else granularity
+    start = period_start(start, granularity)
+    totals = defaultdict(lambda: [0, 0, ZERO])
+    rows = SalesRollup.objects.filter(
+        granularity=source, scope=scope, key=key, bucket__gte=start, bucket__lt=end,
+    ).values_list('bucket', 'orders', 'units', 'revenue')
+    for bucket, orders, units, revenue in rows:
+        point = totals[period_start(bucket, granularity)]
+        point[0] += orders
+        point[1] += units
+        point[2] += revenue
+
+    points = []
+    moment = start
+    while moment < end:
+        orders, units, revenue = totals.get(moment, (0, 0, ZERO))
+        points.append({
+            'period': period_label(moment, granularity),
+            'orders': orders,
+            'units': units,
+            'revenue': str(revenue),
+            'avg_price': str((revenue / units).quantize(Decimal('0.01'))) if units else None,
+        })
+        moment = next_period(moment, granularity)
+    return points
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class TradingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'trading'
+
+    def ready(self):
+        from django.core import checks
+
+        from .instrumentation import register_command_listener
+        from .jwt_auth import check_revocation_cache
+        from .response_cache import check_shared_cache
+        register_command_listener()
+        checks.register(check_shared_cache, checks.Tags.caches)
+        checks.register(check_revocation_cache, checks.Tags.caches)
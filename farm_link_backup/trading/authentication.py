@@ -0,0 +1,153 @@
+"""
+Token authentication with cached token lookups.
+
+DRF's ``TokenAuthentication`` queries the token joined to its user on every
+request. ``CachedTokenAuthentication`` resolves a key from a small
+in-process cache first, then from the shared Django cache, and only queries
+the database on a miss. Deleting a token (logout) or saving its user
+(deactivation, role or email changes) invalidates the cached entries
+through the receivers in ``models.py``.
+
+Other processes can keep serving their own in-process copy for up to
+``AUTH_TOKEN_LOCAL_TIMEOUT`` seconds after an invalidation, so keep that
+value short.
+
+Both caches hold a snapshot of plain values, not model instances: the
+token key and creation time plus the few user fields authentication and
+permission checks read (never the password hash). Each request builds its
+own ``Token`` and user from the snapshot, with every other user field
+deferred, so state one request sets on ``request.user`` never leaks into
+another thread's.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+CACHE_ALIAS = getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 60)
+LOCAL_TIMEOUT = getattr(settings, 'AUTH_TOKEN_LOCAL_TIMEOUT', 5)
+LOCAL_MAX_ENTRIES = getattr(settings, 'AUTH_TOKEN_LOCAL_MAX_ENTRIES', 1000)
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+# Loaded on the cached user; anything else is fetched from the database on first access
+TOKEN_USER_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+def token_cache_key(key):
+    # Never use the raw credential as a cache key
+    return 'auth-token-user:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def token_snapshot(token):
+    return {
+        'key': token.key,
+        'created': token.created.isoformat(),
+        'user': {f: getattr(token.user, f) for f in TOKEN_USER_FIELDS},
+    }
+
+
+def loaded_instance(model, values):
+    # from_db() takes a partial row in the model's field order and defers the rest
+    names = [f.attname for f in model._meta.concrete_fields if f.attname in values]
+    return model.from_db(router.db_for_read(model), names, [values[name] for name in names])
+
+
+def token_from_snapshot(model, snapshot):
+    user = loaded_instance(get_user_model(), snapshot['user'])
+    token = loaded_instance(model, {
+        'key': snapshot['key'], 'user_id': user.pk, 'created': parse_datetime(snapshot['created']),
+    })
+    token.user = user
+    return token
+
+
+class LocalTokenCache:
+    """Thread-safe LRU of ``cache_key -> (expires_at, token snapshot)``; snapshots are never mutated."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, cache_key):
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[cache_key]
+                return None
+            self.entries.move_to_end(cache_key)
+            return entry[1]
+
+    def set(self, cache_key, snapshot):
+        if self.timeout <= 0:
+            return
+        with self.lock:
+            self.entries[cache_key] = (time.monotonic() + self.timeout, snapshot)
+            self.entries.move_to_end(cache_key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, cache_key):
+        with self.lock:
+            self.entries.pop(cache_key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_tokens = LocalTokenCache(LOCAL_MAX_ENTRIES, LOCAL_TIMEOUT)
+
+
+def invalidate_token(key):
+    cache_key = token_cache_key(key)
+    local_tokens.delete(cache_key)
+    get_cache().delete(cache_key)
+
+
+def invalidate_user_tokens(user):
+    from rest_framework.authtoken.models import Token
+
+    for key in Token.objects.filter(user_id=user.pk).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in replacement for ``TokenAuthentication`` (same ``Token`` header and model)."""
+
+    def authenticate_credentials(self, key):
+        model = self.get_model()
+        cache_key = token_cache_key(key)
+        snapshot = local_tokens.get(cache_key)
+        if snapshot is None:
+            snapshot = get_cache().get(cache_key)
+            if snapshot is None:
+                try:
+                    token = model.objects.select_related('user').get(key=key)
+                except model.DoesNotExist:
+                    raise exceptions.AuthenticationFailed(_('Invalid token.'))
+                snapshot = token_snapshot(token)
+                get_cache().set(cache_key, snapshot, CACHE_TIMEOUT)
+            local_tokens.set(cache_key, snapshot)
+
+        token = token_from_snapshot(model, snapshot)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return (token.user, token)
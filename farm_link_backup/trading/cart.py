@@ -0,0 +1,99 @@
+"""
+Persistent cart lines.
+
+Each line is its own ``CartItem`` row holding just the product id and the
+quantity. Adding, changing or removing a line is a single-row write; the
+cart is never rewritten as a whole. Prices always come from the current
+``Product`` rows, and the totals are computed here, never taken from the
+client.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Sum
+
+from .inventory import InsufficientStock
+from .models import Cart, CartItem
+
+TAX_RATE = Decimal(str(getattr(settings, 'CART_TAX_RATE', '0')))
+CENTS = Decimal('0.01')
+
+
+def get_cart(user):
+    cart, _ = Cart.objects.get_or_create(user=user)
+    return cart
+
+
+def cart_lines(cart):
+    return CartItem.objects.filter(cart=cart).select_related('product').order_by('added_at', 'id')
+
+
+def cart_totals(cart):
+    """Subtotal, tax, total and item count in one aggregate query."""
+    agg = CartItem.objects.filter(cart=cart).aggregate(
+        subtotal=Sum(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        item_count=Sum('quantity'),
+        line_count=Count('id'),
+    )
+    subtotal = (agg['subtotal'] or Decimal('0')).quantize(CENTS)
+    tax = (subtotal * TAX_RATE).quantize(CENTS, rounding=ROUND_HALF_UP)
+    return {
+        'subtotal': subtotal,
+        'tax': tax,
+        'total': subtotal + tax,
+        'item_count': agg['item_count'] or 0,
+        'line_count': agg['line_count'],
+    }
+
+
+def add_item(cart, product, quantity=1):
+    """Add ``quantity`` to the product's line, creating it if needed; returns the line."""
+    limit = product.stock - quantity
+    if limit < 0:
+        raise InsufficientStock([product.pk])
+    # Increment in place, but only while the result still fits the stock
+    if CartItem.objects.filter(cart=cart, product=product, quantity__lte=limit).update(quantity=F('quantity') + quantity):
+        return CartItem.objects.select_related('product').get(cart=cart, product=product)
+    if CartItem.objects.filter(cart=cart, product=product).exists():
+        raise InsufficientStock([product.pk])
+    try:
+        with transaction.atomic():
+            return CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+    except IntegrityError:
+        # A concurrent request created the line first
+        return add_item(cart, product, quantity)
+
+
+def set_quantity(cart, product, quantity):
+    """Set the product's line to ``quantity``; 0 removes it. Returns the line or ``None``."""
+    if quantity <= 0:
+        remove_item(cart, product.pk)
+        return None
+    if quantity > product.stock:
+        raise InsufficientStock([product.pk])
+    if CartItem.objects.filter(cart=cart, product=product).update(quantity=quantity):
+        return CartItem(cart=cart, product=product, quantity=quantity)
+    try:
+        with transaction.atomic():
+            return CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+    except IntegrityError:
+        return set_quantity(cart, product, quantity)
+
+
+def remove_item(cart, product_id):
+    deleted, _ = CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+    return bool(deleted)
+
+
+def clear_cart(cart):
+    CartItem.objects.filter(cart=cart).delete()
+
+
+def replace_cart(cart, lines):
+    """Overwrite every line with validated ``[{'product': Product, 'quantity': int}]``."""
+    with transaction.atomic():
+        clear_cart(cart)
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product=line['product'], quantity=line['quantity']) for line in lines
+        )
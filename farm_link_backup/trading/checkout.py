@@ -0,0 +1,148 @@
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .analytics import record_order
+from .daraja import DarajaError, get_client as get_daraja_client
+from .inventory import hold_stock, release_stock, reserve_stock
+from .models import IdempotencyKey, Order, OrderItem, Payment
+
+
+class CheckoutInProgress(Exception):
+    """Another request with the same idempotency key has not finished yet."""
+
+
+class CheckoutCancelled(Exception):
+    """The order made with this idempotency key was cancelled; a new key is needed to order again."""
+
+    def __init__(self, order):
+        super().__init__(order.pk)
+        self.order = order
+
+
+def order_total(items):
+    return sum((Decimal(str(item['product'].price)) * item['quantity'] for item in items), Decimal('0.00'))
+
+
+def create_order_with_payment(user, data):
+    """
+    Reserve stock, then create the order, its items and a pending M-Pesa
+    payment together. The stock stays on a time-limited hold until the
+    payment resolves. Raises ``InsufficientStock`` if the cart can't be filled.
+    """
+    items = data['items']
+    reserved = reserve_stock({item['product'].pk: item['quantity'] for item in items})
+    try:
+        order, payment = _create_order_with_payment(user, data, items)
+        # Released by mpesa_callback on failure, or by release_expired_holds
+        hold_stock(order, reserved)
+    except Exception:
+        release_stock(reserved)
+        raise
+    return order, payment
+
+
+def _create_order_with_payment(user, data, items):
+    with transaction.atomic():
+        order = Order.objects.create(
+            user=user,
+            customer_name=data['customer_name'],
+            customer_email=data['customer_email'],
+            phone_number=data['phone_number'],
+            shipping_address=data['shipping_address'],
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item['product'], quantity=item['quantity'], unit_price=item['product'].price)
+            for item in items
+        ])
+        record_order(order, items)
+        payment = Payment.objects.create(
+            user=user,
+            order=order,
+            amount=order_total(items),
+            status='pending',
+            payment_method='mpesa',
+        )
+    return order, payment
+
+
+def request_payment(order, payment):
+    """Send the STK push for ``payment``; record the outcome on the payment."""
+    try:
+        # M-Pesa only accepts whole shillings
+        result = get_daraja_client().stk_push(order.phone_number, amount=math.ceil(payment.amount))
+    except DarajaError as e:
+        result = {'errorMessage': str(e)}
+
+    if result.get('ResponseCode') == '0':
+        payment.status = 'pending'
+        payment.transaction_id = result.get('CheckoutRequestID')
+    else:
+        payment.status = 'failed'
+    payment.save(update_fields=['status', 'transaction_id'])
+    return result
+
+
+def previous_checkout(user, idempotency_key):
+    """
+    Replay the checkout ``user`` already made with ``idempotency_key``.
+
+    Returns ``(order, payment, stk_result)``, or ``None`` when the key is
+    unused. The STK push is resent only if the previous one failed. Raises
+    ``CheckoutCancelled`` once the order was cancelled, and
+    ``CheckoutInProgress`` while the first request is still running. A key
+    whose request died before creating an order is freed after
+    ``CHECKOUT_KEY_TIMEOUT`` seconds.
+    """
+    key = IdempotencyKey.objects.filter(user=user, key=idempotency_key).select_related('order').first()
+    if key is None:
+        return None
+    if key.order_id is None:
+        if key.created_at > timezone.now() - timedelta(seconds=settings.CHECKOUT_KEY_TIMEOUT):
+            raise CheckoutInProgress(idempotency_key)
+        IdempotencyKey.objects.filter(pk=key.pk, order__isnull=True).delete()
+        return None
+
+    order = key.order
+    if order.status == 'cancelled':
+        raise CheckoutCancelled(order)
+    payment = Payment.objects.filter(order=order).order_by('-id').first()
+    stk_result = None
+    if payment and payment.status == 'failed':
+        stk_result = request_payment(order, payment)
+    return order, payment, stk_result
+
+
+def checkout(user, data, idempotency_key=None):
+    """
+    Place an order and start its payment.
+
+    Returns ``(order, payment, stk_result, created)``. When
+    ``idempotency_key`` was already used by ``user``, the original order is
+    returned with ``created=False`` (see :func:`previous_checkout`).
+    """
+    key = None
+    if idempotency_key:
+        previous = previous_checkout(user, idempotency_key)
+        if previous is not None:
+            return (*previous, False)
+        key, created = IdempotencyKey.objects.get_or_create(user=user, key=idempotency_key)
+        if not created:
+            # A concurrent request with the same key got there first
+            raise CheckoutInProgress(idempotency_key)
+
+    try:
+        order, payment = create_order_with_payment(user, data)
+    except Exception:
+        if key is not None:
+            key.delete()
+        raise
+
+    if key is not None:
+        key.order = order
+        key.save(update_fields=['order'])
+    return order, payment, request_payment(order, payment), True
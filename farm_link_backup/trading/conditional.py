@@ -0,0 +1,66 @@
+"""
+Conditional GET support for DRF views.
+
+Works like Django's ``condition`` decorator, but the validators run inside
+DRF, after authentication, so they can depend on ``request.user``. A
+validator returns ``(etag, last_modified)`` from a cheap aggregate over row
+timestamps. When the client already has that version, the view (and its
+serializer) is skipped and a 304 is sent.
+"""
+import calendar
+import functools
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def version_validators(*parts):
+    """Build ``(etag, last_modified)`` from timestamps/counts; ``None`` parts are skipped."""
+    timestamps = [part for part in parts if hasattr(part, 'utctimetuple')]
+    last_modified = max(timestamps) if timestamps else None
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return digest, last_modified
+
+
+def queryset_version(queryset, field='updated_at'):
+    """Return ``(latest timestamp, row count)`` for ``queryset`` in one aggregate query."""
+    stats = queryset.aggregate(latest=Max(field), count=Count('pk'))
+    return stats['latest'], stats['count']
+
+
+def conditional(validators, private=False):
+    """
+    Decorate a view (or, via ``method_decorator``, a view method) so that
+    ``validators(request, *args, **kwargs)`` decides whether it can answer 304.
+
+    Responses are marked ``no-cache`` so browsers keep them but revalidate on
+    every use; ``private`` ones also vary on the ``Authorization`` header.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return func(request, *args, **kwargs)
+
+            etag, last_modified = validators(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag else None
+            timestamp = calendar.timegm(last_modified.utctimetuple()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = func(request, *args, **kwargs)
+            if private:
+                patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ['Authorization'])
+            else:
+                patch_cache_control(response, no_cache=True)
+            if 200 <= response.status_code < 300:
+                if timestamp and not response.has_header('Last-Modified'):
+                    response['Last-Modified'] = http_date(timestamp)
+                if etag:
+                    response.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
@@ -0,0 +1,174 @@
+"""
+Client for Safaricom's Daraja (M-Pesa) API.
+
+One ``DarajaClient`` per process keeps a pooled ``requests.Session`` and the
+OAuth access token. The token is reused until shortly before it expires,
+and only one thread refreshes it at a time.
+"""
+import base64
+import datetime
+import hmac
+import threading
+import time
+from urllib.parse import urlencode
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+class DarajaError(Exception):
+    pass
+
+
+class DarajaClient:
+    token_path = '/oauth/v1/generate?grant_type=client_credentials'
+    stk_push_path = '/mpesa/stkpush/v1/processrequest'
+
+    def __init__(self, base_url, consumer_key, consumer_secret, shortcode, passkey, callback_url,
+                 timeout=(3.05, 15), token_refresh_margin=60, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.shortcode = shortcode
+        self.passkey = passkey
+        self.callback_url = callback_url
+        self.timeout = timeout
+        self.token_refresh_margin = token_refresh_margin
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    # ==================== AUTH ====================
+    def _token_is_fresh(self):
+        return self._token is not None and time.monotonic() < self._token_expires_at
+
+    def access_token(self):
+        if self._token_is_fresh():
+            return self._token
+        with self._token_lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._token_is_fresh():
+                return self._token
+            try:
+                response = self.session.get(
+                    self.base_url + self.token_path,
+                    auth=(self.consumer_key, self.consumer_secret),
+                    timeout=self.timeout,
+                )
+                response.raise_for_status()
+                data = response.json()
+                token = data['access_token']
+                expires_in = int(data.get('expires_in', 3599))
+            except (requests.RequestException, ValueError, KeyError) as e:
+                raise DarajaError(f'Could not obtain an M-Pesa access token: {e}') from e
+            self._token = token
+            self._token_expires_at = time.monotonic() + max(expires_in - self.token_refresh_margin, 0)
+            return token
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+            self._token_expires_at = 0.0
+
+    # ==================== STK PUSH ====================
+    def stk_push(self, phone, amount, account_reference='Farmlink', description='FarmLink Purchase'):
+        """Start an STK push and return Daraja's JSON response."""
+        timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        password = base64.b64encode((self.shortcode + self.passkey + timestamp).encode()).decode()
+        payload = {
+            "BusinessShortCode": self.shortcode,
+            "Password": password,
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": amount,
+            "PartyA": phone,
+            "PartyB": self.shortcode,
+            "PhoneNumber": phone,
+            "CallBackURL": self.callback_url,
+            "AccountReference": account_reference,
+            "TransactionDesc": description,
+        }
+
+        for attempt in range(2):
+            try:
+                response = self.session.post(
+                    self.base_url + self.stk_push_path,
+                    headers={'Authorization': f'Bearer {self.access_token()}'},
+                    json=payload,
+                    timeout=self.timeout,
+                )
+            except requests.RequestException as e:
+                raise DarajaError(f'STK push request failed: {e}') from e
+            # A token revoked before its expiry gets one refresh and retry
+            if response.status_code == 401 and attempt == 0:
+                self.invalidate_token()
+                continue
+            break
+
+        try:
+            return response.json()
+        except ValueError as e:
+            raise DarajaError(f'Unexpected STK push response ({response.status_code})') from e
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DarajaClient(
+                    base_url=settings.MPESA_BASE_URL,
+                    consumer_key=settings.MPESA_CONSUMER_KEY,
+                    consumer_secret=settings.MPESA_CONSUMER_SECRET,
+                    shortcode=settings.MPESA_SHORTCODE,
+                    passkey=settings.MPESA_PASSKEY,
+                    callback_url=callback_url(),
+                    timeout=(settings.MPESA_CONNECT_TIMEOUT, settings.MPESA_READ_TIMEOUT),
+                )
+    return _client
+
+
+# ==================== CALLBACKS ====================
+def callback_url():
+    """``MPESA_CALLBACK_URL`` carrying the shared secret that :func:`verify_callback` checks."""
+    url = settings.MPESA_CALLBACK_URL
+    if not settings.MPESA_CALLBACK_SECRET:
+        return url
+    return f"{url}{'&' if '?' in url else '?'}{urlencode({'token': settings.MPESA_CALLBACK_SECRET})}"
+
+
+def verify_callback(request):
+    """
+    Whether an incoming STK callback really comes from Daraja.
+
+    Daraja doesn't sign callbacks, so the URL we hand it carries a secret
+    token, optionally backed by an allow-list of Safaricom's addresses.
+    Without a secret configured, callbacks are only trusted in DEBUG.
+    """
+    secret = settings.MPESA_CALLBACK_SECRET
+    if not secret:
+        return settings.DEBUG
+    if not hmac.compare_digest(request.GET.get('token', ''), secret):
+        return False
+    allowed = settings.MPESA_CALLBACK_IPS
+    return not allowed or request.META.get('REMOTE_ADDR') in allowed
+
+
+def callback_receipt(data):
+    """The ``MpesaReceiptNumber`` from a successful callback's ``CallbackMetadata``, if present."""
+    items = (data.get('CallbackMetadata') or {}).get('Item') or []
+    for item in items:
+        if item.get('Name') == 'MpesaReceiptNumber':
+            return item.get('Value')
+    return None
@@ -0,0 +1,132 @@
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from .models import Order
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'off'}
+
+
+def parse_bool(value, param):
+    value = value.strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValidationError({param: 'Expected a boolean (true/false).'})
+
+
+def parse_decimal(value, param):
+    try:
+        return Decimal(value)
+    except (InvalidOperation, TypeError):
+        raise ValidationError({param: 'Expected a number.'})
+
+
+def parse_int(value, param):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({param: 'Expected an integer.'})
+
+
+def parse_datetime_bound(value, param, end_of_day=False):
+    """Parse an ISO date or datetime; bare dates cover the whole day when ``end_of_day``."""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError
+            if end_of_day:
+                day += datetime.timedelta(days=1)
+            parsed = datetime.datetime.combine(day, datetime.time.min)
+    except ValueError:
+        raise ValidationError({param: 'Expected an ISO 8601 date or datetime.'})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+# ==================== PRODUCTS ====================
+class ProductFilter(BaseFilterBackend):
+    """
+    Server-side catalog filters.
+
+    Supported query parameters:
+      ?category=<id>            ?category_name=<name>
+      ?min_price=<n>            ?max_price=<n>
+      ?is_vaccinated=true|false ?in_stock=true|false
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if params.get('category'):
+            queryset = queryset.filter(category_id=parse_int(params['category'], 'category'))
+        if params.get('category_name'):
+            queryset = queryset.filter(category__name__iexact=params['category_name'])
+        if params.get('min_price'):
+            queryset = queryset.filter(price__gte=parse_decimal(params['min_price'], 'min_price'))
+        if params.get('max_price'):
+            queryset = queryset.filter(price__lte=parse_decimal(params['max_price'], 'max_price'))
+        if params.get('is_vaccinated'):
+            queryset = queryset.filter(is_vaccinated=parse_bool(params['is_vaccinated'], 'is_vaccinated'))
+        if params.get('in_stock'):
+            if parse_bool(params['in_stock'], 'in_stock'):
+                queryset = queryset.filter(stock__gt=0)
+            else:
+                queryset = queryset.filter(stock=0)
+        return queryset
+
+
+class StableOrderingFilter(OrderingFilter):
+    """
+    ``?ordering=`` with ``-id`` appended as a tie-breaker.
+
+    Many products share a price, name or stock level. Without a unique last
+    key their order is undefined, and the cursor pagination can skip or
+    repeat rows between pages.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view) or [])
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('-id')
+        return ordering
+
+
+# ==================== ORDERS ====================
+class AdminOrderFilter(BaseFilterBackend):
+    """
+    Filters for the admin order console.
+
+    Supported query parameters:
+      ?status=<status>
+      ?created_after=<date|datetime>  ?created_before=<date|datetime>
+      ?customer_email=<email>
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if params.get('status'):
+            if params['status'] not in dict(Order.STATUS_CHOICES):
+                raise ValidationError({'status': 'Invalid status'})
+            queryset = queryset.filter(status=params['status'])
+        if params.get('created_after'):
+            queryset = queryset.filter(
+                created_at__gte=parse_datetime_bound(params['created_after'], 'created_after')
+            )
+        if params.get('created_before'):
+            queryset = queryset.filter(
+                created_at__lt=parse_datetime_bound(params['created_before'], 'created_before', end_of_day=True)
+            )
+        if params.get('customer_email'):
+            queryset = queryset.filter(customer_email__iexact=params['customer_email'].strip())
+        return queryset
@@ -0,0 +1,152 @@
+"""
+Product photo variants.
+
+Uploads are queued as ``ImageJob`` rows when a product is saved with a new
+image. The ``run_image_worker`` command builds a thumbnail, card and detail
+size for each one. Every variant is saved as JPEG, and also as WebP when
+Pillow was built with WebP support. Orientation is applied and EXIF
+metadata (camera details, GPS) is dropped.
+
+Variant files are deleted once nothing points at them: after a new set
+replaces them, when the image is replaced or removed, and when the product
+is deleted. Deletion waits for the transaction that dropped the references
+to commit.
+"""
+import hashlib
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import ImageJob, Product
+from .response_cache import invalidate
+
+logger = logging.getLogger(__name__)
+
+# name: (max width, max height); aspect ratio is kept
+VARIANTS = {
+    'thumbnail': (200, 200),
+    'card': (480, 480),
+    'detail': (1200, 1200),
+}
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+MAX_ATTEMPTS = 3
+
+
+def webp_supported():
+    return features.check('webp')
+
+
+def variant_path(product, source, variant, extension, data):
+    # The content hash in the name lets media responses be cached as immutable
+    stem = os.path.splitext(os.path.basename(source))[0]
+    digest = hashlib.md5(data).hexdigest()[:12]
+    return f'products/variants/{product.pk}/{stem}-{variant}.{digest}.{extension}'
+
+
+def encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == 'jpeg':
+        if image.mode not in ('RGB', 'L'):
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image.convert('RGBA'), mask=image.convert('RGBA').split()[-1])
+            image = background
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def build_variants(product, source):
+    """Write every variant of ``source`` to storage; return ``{variant: {format: path}}``."""
+    formats = ['jpeg', 'webp'] if webp_supported() else ['jpeg']
+    with default_storage.open(source, 'rb') as f:
+        original = Image.open(f)
+        original.load()
+    # Bake the EXIF orientation into the pixels; re-encoding drops the rest of EXIF
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'RGBA', 'L'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+    variants = {}
+    for name, size in VARIANTS.items():
+        image = original.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        variants[name] = {}
+        for fmt in formats:
+            data = encode(image, fmt)
+            path = variant_path(product, source, name, 'jpg' if fmt == 'jpeg' else 'webp', data)
+            if not default_storage.exists(path):
+                path = default_storage.save(path, ContentFile(data))
+            variants[name][fmt] = path
+    return variants
+
+
+def variant_files(variants):
+    """Every storage path in an ``image_variants`` mapping."""
+    return {path for formats in (variants or {}).values() for path in formats.values()}
+
+
+def delete_files(paths):
+    for path in paths:
+        try:
+            default_storage.delete(path)
+        except Exception as e:
+            logger.warning("Could not delete image variant %s: %s", path, e)
+
+
+def discard_variants(paths):
+    """Delete variant files once the current transaction (if any) commits."""
+    paths = set(paths)
+    if paths:
+        transaction.on_commit(lambda: delete_files(paths))
+
+
+# ==================== WORKER ====================
+def claim_job():
+    for pk in ImageJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)[:10]:
+        if ImageJob.objects.filter(pk=pk, status='queued').update(status='processing'):
+            return ImageJob.objects.select_related('product').get(pk=pk)
+    return None
+
+
+def process_job(job):
+    product = job.product
+    if not product.image or product.image.name != job.source:
+        # A newer upload replaced this one and has its own job
+        ImageJob.objects.filter(pk=job.pk).update(status='done')
+        return False
+    try:
+        variants = build_variants(product, job.source)
+    except Exception as e:
+        attempts = job.attempts + 1
+        status = 'failed' if attempts >= MAX_ATTEMPTS else 'queued'
+        ImageJob.objects.filter(pk=job.pk).update(status=status, attempts=attempts, last_error=str(e))
+        logger.warning("Image variants for %s failed (attempt %s): %s", job.source, attempts, e)
+        return False
+
+    # update() keeps post_save (and another ImageJob) from firing; updated_at moves the product's ETags
+    saved = Product.objects.filter(pk=product.pk, image=job.source).update(image_variants=variants, updated_at=timezone.now())
+    if saved:
+        discard_variants(variant_files(product.image_variants) - variant_files(variants))
+    else:
+        # The image was replaced while this job ran, so nothing refers to what it built
+        discard_variants(variant_files(variants))
+    invalidate('products')
+    ImageJob.objects.filter(pk=job.pk).update(status='done', attempts=job.attempts + 1)
+    return True
+
+
+def process_next():
+    """Process one queued job; return ``False`` when the queue is empty."""
+    job = claim_job()
+    if job is None:
+        return False
+    process_job(job)
+    return True
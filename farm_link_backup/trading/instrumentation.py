@@ -0,0 +1,225 @@
+"""
+Per-request database, rendering and size metrics.
+
+``RequestMetricsMiddleware`` opens a ``RequestMetrics`` for every request.
+While the view runs, two hooks feed it:
+- A Django execute wrapper counts the ORM statements djongo translates.
+- ``MongoCommandListener``, registered with pymongo when the app loads,
+  counts the MongoDB commands those statements become. These commands are
+  the real round trips.
+Serializers that include ``TimedRepresentation`` add the time spent in
+``to_representation`` to ``serialize_ms``. That time is spent inside the
+view, and any queries a serializer triggers are also counted in the db
+time. The middleware then times DRF's rendering of the finished data to
+JSON (``render_ms``) and records the body size.
+
+Each response carries a ``Server-Timing`` header (shown in the browser's
+network panel) when REQUEST_METRICS_SERVER_TIMING is on. A random
+REQUEST_METRICS_SAMPLE_RATE share of requests is logged to
+``trading.metrics`` as one structured record. Any request slower than
+REQUEST_METRICS_SLOW_MS is always logged to ``trading.metrics.slow`` along
+with its slowest commands.
+"""
+import contextvars
+import heapq
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from pymongo import monitoring
+
+logger = logging.getLogger('trading.metrics')
+slow_logger = logging.getLogger('trading.metrics.slow')
+
+current = contextvars.ContextVar('request_metrics', default=None)
+
+# Commands listed in a slow-request record
+SLOWEST_KEPT = 5
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.commands = 0
+        self.command_time = 0.0
+        self.render_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+        self.pending = {}
+        self.slowest = []  # min-heap of (seconds, command, collection)
+
+    def add_command(self, seconds, command, collection):
+        self.commands += 1
+        self.command_time += seconds
+        entry = (seconds, command, collection or '')
+        if len(self.slowest) < SLOWEST_KEPT:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    @property
+    def db_time(self):
+        # Mongo commands are the actual round trips; other backends only report ORM statements
+        return self.command_time if self.commands else self.query_time
+
+    def server_timing(self, total):
+        parts = [f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries, {self.commands} commands"']
+        if self.serialize_time:
+            parts.append(f'serialize;dur={self.serialize_time * 1000:.1f}')
+        if self.render_time:
+            parts.append(f'render;dur={self.render_time * 1000:.1f};desc="json encode"')
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+    def record(self, request, response, total):
+        match = request.resolver_match
+        return {
+            'method': request.method,
+            'path': request.path,
+            'route': match.route if match else None,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(self.db_time * 1000, 1),
+            'queries': self.queries,
+            'query_ms': round(self.query_time * 1000, 1),
+            'mongo_commands': self.commands,
+            'mongo_ms': round(self.command_time * 1000, 1),
+            'serialize_ms': round(self.serialize_time * 1000, 1),
+            'render_ms': round(self.render_time * 1000, 1),
+            # Streamed bodies are produced after the middleware returns
+            'response_bytes': None if response.streaming else len(response.content),
+        }
+
+
+# ==================== HOOKS ====================
+class MongoCommandListener(monitoring.CommandListener):
+    """Adds each MongoDB command run during a request to that request's metrics."""
+
+    def started(self, event):
+        metrics = current.get()
+        if metrics is not None:
+            target = event.command.get(event.command_name)
+            metrics.pending[event.request_id] = target if isinstance(target, str) else None
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        metrics = current.get()
+        if metrics is not None:
+            collection = metrics.pending.pop(event.request_id, None)
+            metrics.add_command(event.duration_micros / 1e6, event.command_name, collection)
+
+
+def register_command_listener():
+    """Called from ``TradingConfig.ready`` so the listener is in place before djongo opens its client."""
+    if getattr(settings, 'REQUEST_METRICS_ENABLED', False):
+        monitoring.register(MongoCommandListener())
+
+
+class TimedRepresentation:
+    """
+    Serializer mixin that adds ``to_representation`` time to the request's metrics.
+
+    Only the outermost call is timed, so nested serializers and the items
+    of a ``many=True`` list are not counted twice.
+    """
+
+    def to_representation(self, instance):
+        metrics = current.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        metrics.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serialize_time += time.perf_counter() - started
+            metrics.serializing = False
+
+
+def count_query(execute, sql, params, many, context):
+    metrics = current.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if metrics is not None:
+            metrics.queries += 1
+            metrics.query_time += time.perf_counter() - started
+
+
+# ==================== MIDDLEWARE ====================
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        self.slow_seconds = settings.REQUEST_METRICS_SLOW_MS / 1000
+        self.server_timing = settings.REQUEST_METRICS_SERVER_TIMING
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(count_query))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        total = time.perf_counter() - metrics.started
+
+        if self.server_timing:
+            response['Server-Timing'] = metrics.server_timing(total)
+        slow = total >= self.slow_seconds
+        if slow or random.random() < self.sample_rate:
+            record = metrics.record(request, response, total)
+            if slow:
+                record['slowest_commands'] = [
+                    {'command': command, 'collection': collection, 'ms': round(seconds * 1000, 1)}
+                    for seconds, command, collection in sorted(metrics.slowest, reverse=True)
+                ]
+                slow_logger.warning('slow request', extra={'metrics': record})
+            else:
+                logger.info('request', extra={'metrics': record})
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are encoded after the view returns; time that separately from the view
+        metrics = current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+# ==================== LOGGING ====================
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the record's ``metrics`` merged in."""
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        payload.update(getattr(record, 'metrics', {}))
+        return json.dumps(payload, default=str)
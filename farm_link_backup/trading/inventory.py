@@ -0,0 +1,193 @@
+import datetime
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .analytics import record_cancellation
+from .models import Order, OrderItem, Payment, Product, StockHold
+from .related import refresh_category_index
+from .response_cache import invalidate
+
+logger = logging.getLogger(__name__)
+
+HOLD_TTL = datetime.timedelta(seconds=getattr(settings, 'STOCK_HOLD_TTL', 15 * 60))
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f"Not enough stock for product(s): {', '.join(map(str, product_ids))}")
+
+
+def reserve_stock(quantities):
+    """
+    Take ``{product_id: quantity}`` out of stock, all or nothing.
+
+    Each product is decremented with a conditional update
+    (``stock >= quantity``), so concurrent buyers can never drive stock
+    below zero. If any product is short, the decrements already applied
+    are given back and ``InsufficientStock`` is raised.
+    """
+    reserved = {}
+    # A fixed order keeps concurrent multi-item carts from interleaving badly
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        updated = Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+            stock=F('stock') - quantity, updated_at=timezone.now()
+        )
+        if not updated:
+            release_stock(reserved)
+            raise InsufficientStock([product_id])
+        reserved[product_id] = quantity
+    # update() skips post_save, so cached catalog pages and indexes are refreshed here
+    invalidate('products')
+    refresh_category_indexes(Q(pk__in=list(reserved), stock=0))
+    return reserved
+
+
+def release_stock(quantities):
+    for product_id, quantity in quantities.items():
+        Product.objects.filter(pk=product_id).update(stock=F('stock') + quantity, updated_at=timezone.now())
+    if quantities:
+        invalidate('products')
+        # Products back at exactly the released quantity were sold out until now
+        back_in_stock = Q()
+        for product_id, quantity in quantities.items():
+            back_in_stock |= Q(pk=product_id, stock=quantity)
+        refresh_category_indexes(back_in_stock)
+
+
+def refresh_category_indexes(products):
+    """
+    Rebuild the related-products index of each category with a product matching ``products``.
+
+    The index lists only in-stock products, so it only changes when a
+    product sells out or comes back into stock.
+    """
+    category_ids = set(Product.objects.filter(products).values_list('category_id', flat=True))
+    for category_id in category_ids:
+        refresh_category_index(category_id)
+
+
+# ==================== HOLDS ====================
+def hold_stock(order, quantities):
+    """Record stock already reserved for ``order`` as a hold that expires after ``HOLD_TTL``."""
+    return StockHold.objects.create(
+        order=order,
+        lines=[[product_id, quantity] for product_id, quantity in quantities.items()],
+        expires_at=timezone.now() + HOLD_TTL,
+    )
+
+
+def _transition(order_id, to_status):
+    """Move a held hold to ``to_status``; only one caller can win."""
+    return StockHold.objects.filter(order_id=order_id, status='held').update(status=to_status) == 1
+
+
+def commit_hold(order):
+    """
+    Make the reservation for a paid order permanent.
+
+    If the hold already expired and its stock went back on sale, try to take
+    it again; on success the order leaves 'cancelled' and goes back into
+    the sales rollups. If that fails the order was oversold, so it is logged
+    for a refund and ``False`` is returned.
+    """
+    if _transition(order.pk, 'committed'):
+        return True
+    hold = StockHold.objects.filter(order_id=order.pk, status='released').first()
+    if hold is None:
+        return True  # no hold (legacy order) or already committed
+    try:
+        reserve_stock(hold.quantities)
+    except InsufficientStock as e:
+        logger.error("Order #%s was paid after its stock hold lapsed and %s; refund needed", order.pk, e)
+        return False
+    with transaction.atomic():
+        StockHold.objects.filter(pk=hold.pk).update(status='committed')
+        reinstated = Order.objects.filter(pk=order.pk, status='cancelled').update(
+            status='pending', updated_at=timezone.now()
+        )
+        if reinstated:
+            record_cancellation(order.pk, sign=1)
+    return True
+
+
+def release_hold(order, order_status='cancelled', payment_status='failed'):
+    """Give a held order's stock back and cancel the order; ``False`` if nothing was held."""
+    if not _transition(order.pk, 'released'):
+        return False
+    release_stock(StockHold.objects.get(order_id=order.pk).quantities)
+    cancelled = Order.objects.filter(pk=order.pk).exclude(status='cancelled').update(
+        status=order_status, updated_at=timezone.now()
+    )
+    if cancelled and order_status == 'cancelled':
+        record_cancellation(order.pk)
+    Payment.objects.filter(order_id=order.pk, status='pending').update(status=payment_status)
+    return True
+
+
+def order_quantities(order_id):
+    quantities = Counter()
+    for product_id, quantity in OrderItem.objects.filter(order_id=order_id).values_list('product_id', 'quantity'):
+        quantities[product_id] += quantity
+    return dict(quantities)
+
+
+# ==================== ADMIN STATUS CHANGES ====================
+def cancel_order(order):
+    """
+    Cancel ``order`` and put its stock back on sale; ``False`` if it was already cancelled.
+
+    A held order is released like an unpaid one. Otherwise its stock was
+    taken for good (paid, or placed without a hold) and is returned here.
+    """
+    if release_hold(order, payment_status='cancelled'):
+        return True
+    with transaction.atomic():
+        cancelled = Order.objects.filter(pk=order.pk).exclude(status='cancelled').update(
+            status='cancelled', updated_at=timezone.now()
+        )
+        if not cancelled:
+            return False
+        StockHold.objects.filter(order_id=order.pk, status='committed').update(status='released')
+        release_stock(order_quantities(order.pk))
+        record_cancellation(order.pk)
+    return True
+
+
+def reinstate_order(order, order_status):
+    """
+    Move a cancelled ``order`` to ``order_status`` and take its stock again.
+
+    Returns ``False`` if the order is no longer cancelled. Raises
+    ``InsufficientStock``, leaving the order cancelled, if the stock has
+    been sold in the meantime.
+    """
+    with transaction.atomic():
+        reinstated = Order.objects.filter(pk=order.pk, status='cancelled').update(
+            status=order_status, updated_at=timezone.now()
+        )
+        if not reinstated:
+            return False
+        reserve_stock(order_quantities(order.pk))
+        StockHold.objects.filter(order_id=order.pk, status='released').update(status='committed')
+        record_cancellation(order.pk, sign=1)
+    return True
+
+
+def release_expired_holds(now=None):
+    """Release every hold past its expiry; returns how many were released."""
+    now = now or timezone.now()
+    expired = StockHold.objects.filter(status='held', expires_at__lte=now).values_list('order_id', flat=True)
+    released = 0
+    for order_id in list(expired):
+        if release_hold(Order(pk=order_id), payment_status='expired'):
+            released += 1
+    if released:
+        logger.info("Released %s expired stock hold(s)", released)
+    return released
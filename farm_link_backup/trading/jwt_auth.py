@@ -0,0 +1,133 @@
+"""
+Opt-in stateless JWT authentication (``JWT_AUTH_ENABLED=1``).
+
+Access tokens carry the user's id, email, username and staff flags.
+``StatelessJWTAuthentication`` checks the signature and expiry, checks the
+revocation list in the cache, and builds the user from the claims. The
+database is not queried. The user's other fields are deferred and only load
+if a view reads them.
+
+Revocations are stored in the ``JWT_REVOCATION_CACHE_ALIAS`` cache and are
+not tracked in simplejwt's blacklist tables. A revoked ``jti`` is kept only
+until the token would have expired anyway. A per-user cutoff rejects every
+token issued before a change to the user's password, activation, staff
+flags or claims. Both kinds of entry expire on their own, so the list stays
+bounded.
+
+The cache is only the fast path for access tokens. Refreshing reads the
+user from the database, so ``CustomUser.tokens_valid_after`` still applies
+after a cache loss. Access tokens are checked against the cache alone, so a
+revocation written in one worker must be visible to all of them;
+``check_revocation_cache`` warns when the alias is private to each process. New tokens are built from the user's current fields,
+not copied from the old token, so a demoted admin can't refresh their way
+back to admin claims.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import checks
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .response_cache import PROCESS_LOCAL_BACKENDS
+
+CACHE_ALIAS = getattr(settings, 'JWT_REVOCATION_CACHE_ALIAS', 'default')
+CLAIM_FIELDS = ('email', 'username', 'is_staff', 'is_superuser')
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def check_revocation_cache(app_configs, **kwargs):
+    """Registered in ``TradingConfig.ready``: a revocation only reaches every worker through a shared cache."""
+    backend = settings.CACHES.get(CACHE_ALIAS, {}).get('BACKEND')
+    if not getattr(settings, 'JWT_AUTH_ENABLED', False) or settings.DEBUG or backend not in PROCESS_LOCAL_BACKENDS:
+        return []
+    return [checks.Warning(
+        f"JWT_REVOCATION_CACHE_ALIAS '{CACHE_ALIAS}' uses {backend}, which is private to each process.",
+        hint='Set REDIS_URL (or another shared cache) so revoked access tokens are rejected by every worker.',
+        id='trading.W002',
+    )]
+
+
+def revoked_key(jti):
+    return f'jwt:revoked:{jti}'
+
+
+def user_cutoff_key(user_id):
+    return f'jwt:user-cutoff:{user_id}'
+
+
+def revoke_token(token):
+    remaining = int(token['exp'] - time.time())
+    if remaining > 0:
+        get_cache().set(revoked_key(token[api_settings.JTI_CLAIM]), True, remaining)
+
+
+def revoke_user_tokens(user_id):
+    # Nothing issued before now outlives a refresh token's lifetime
+    timeout = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+    get_cache().set(user_cutoff_key(user_id), time.time(), timeout)
+
+
+def check_not_revoked(token):
+    jti_key = revoked_key(token[api_settings.JTI_CLAIM])
+    cutoff_key = user_cutoff_key(token.get(api_settings.USER_ID_CLAIM))
+    state = get_cache().get_many([jti_key, cutoff_key])
+    if state.get(jti_key):
+        raise InvalidToken(_('Token has been revoked.'))
+    cutoff = state.get(cutoff_key)
+    if cutoff is not None and token.get('iat', 0) <= cutoff:
+        raise InvalidToken(_('Token has been revoked.'))
+
+
+def user_from_claims(token):
+    """An unsaved-looking user built from claims; fields not in the token are deferred."""
+    User = get_user_model()
+    claims = {field: token.get(field) for field in CLAIM_FIELDS}
+    claims[User._meta.pk.attname] = token[api_settings.USER_ID_CLAIM]
+    claims['is_active'] = True  # deactivation revokes every token of the user
+    fields = [f.attname for f in User._meta.concrete_fields if f.attname in claims]
+    return User.from_db(DEFAULT_DB_ALIAS, fields, [claims[name] for name in fields])
+
+
+def current_user(token):
+    """The token's user from the database, if it is active and the token predates no revocation."""
+    User = get_user_model()
+    try:
+        user = User.objects.get(pk=token[api_settings.USER_ID_CLAIM], is_active=True)
+    except User.DoesNotExist:
+        raise InvalidToken(_('Token has been revoked.'))
+    if user.tokens_valid_after and token.get('iat', 0) <= user.tokens_valid_after.timestamp():
+        raise InvalidToken(_('Token has been revoked.'))
+    return user
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token whose derived access tokens carry the user claims."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        # Sub-second precision so a token issued right after a revocation isn't caught by it
+        token['iat'] = time.time()
+        for field in CLAIM_FIELDS:
+            token[field] = getattr(user, field)
+        return token
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        check_not_revoked(token)
+        return token
+
+    def get_user(self, validated_token):
+        return user_from_claims(validated_token)
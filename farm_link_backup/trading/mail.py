@@ -0,0 +1,181 @@
+"""
+Outbound email queue.
+
+``QueuedEmailBackend`` is a Django email backend that stores messages as
+``QueuedEmail`` rows instead of talking to the mail server, so ``send_mail``
+and Djoser emails return as soon as the row is written. ``deliver_due`` (run
+by the ``run_mail_worker`` command) claims due rows in batches and sends each
+batch over one connection of the real backend, retrying failures with
+exponential backoff.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db.models import F
+from django.utils import timezone
+
+from .models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_BACKEND = getattr(
+    settings, 'MAIL_QUEUE_DELIVERY_BACKEND', 'django.core.mail.backends.smtp.EmailBackend'
+)
+MAX_ATTEMPTS = getattr(settings, 'MAIL_QUEUE_MAX_ATTEMPTS', 6)
+RETRY_BASE_DELAY = getattr(settings, 'MAIL_QUEUE_RETRY_BASE_DELAY', 30)  # seconds
+RETRY_MAX_DELAY = 60 * 60
+# A row stuck in "sending" this long belongs to a dead worker and is reclaimed
+LOCK_TIMEOUT = datetime.timedelta(minutes=10)
+
+
+def html_alternative(message):
+    for content, mimetype in getattr(message, 'alternatives', []):
+        if mimetype == 'text/html':
+            return content
+    return ''
+
+
+# ==================== ENQUEUE ====================
+class QueuedEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        queued, direct = [], []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            # Attachments are not persisted; those few messages go out right away
+            (direct if message.attachments else queued).append(message)
+
+        QueuedEmail.objects.bulk_create([
+            QueuedEmail(
+                subject=message.subject,
+                body=message.body,
+                html_body=html_alternative(message),
+                from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+                to=list(message.to),
+                cc=list(message.cc),
+                bcc=list(message.bcc),
+                reply_to=list(message.reply_to),
+                headers=dict(message.extra_headers),
+            )
+            for message in queued
+        ])
+        sent = len(queued)
+        if direct:
+            connection = get_connection(DELIVERY_BACKEND, fail_silently=self.fail_silently)
+            sent += connection.send_messages(direct) or 0
+        return sent
+
+
+# ==================== DELIVERY ====================
+def claim_batch(limit):
+    """
+    Atomically mark up to ``limit`` due messages as ``sending`` and return them.
+
+    Each row is claimed with a conditional update, so concurrent workers
+    never send the same message twice. Reclaiming a stale ``sending`` row
+    counts the interrupted delivery as an attempt, so a message that keeps
+    killing its worker is marked failed after MAX_ATTEMPTS.
+    """
+    now = timezone.now()
+    candidates = list(
+        QueuedEmail.objects.filter(status='queued', next_attempt_at__lte=now)
+        .order_by('next_attempt_at')
+        .values_list('id', flat=True)[:limit]
+    )
+    if len(candidates) < limit:
+        candidates += list(
+            QueuedEmail.objects.filter(status='sending', locked_at__lt=now - LOCK_TIMEOUT)
+            .values_list('id', flat=True)[:limit - len(candidates)]
+        )
+
+    claimed = []
+    for pk in candidates:
+        stale = QueuedEmail.objects.filter(pk=pk, status='sending', locked_at__lt=now - LOCK_TIMEOUT)
+        due = QueuedEmail.objects.filter(pk=pk, status='queued')
+        if due.update(status='sending', locked_at=now):
+            claimed.append(pk)
+        elif stale.filter(attempts__lt=MAX_ATTEMPTS - 1).update(locked_at=now, attempts=F('attempts') + 1):
+            claimed.append(pk)
+        elif stale.update(
+            status='failed', locked_at=None, attempts=F('attempts') + 1,
+            last_error='Worker stopped while sending',
+        ):
+            logger.error("Giving up on email %s after %s attempts; the last one was interrupted", pk, MAX_ATTEMPTS)
+    return list(QueuedEmail.objects.filter(pk__in=claimed))
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.to,
+        cc=email.cc,
+        bcc=email.bcc,
+        reply_to=email.reply_to,
+        headers=email.headers,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def retry_delay(attempts):
+    return datetime.timedelta(seconds=min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY))
+
+
+def mark_failed_attempt(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    email.locked_at = None
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = 'failed'
+        logger.error("Giving up on email %s to %s after %s attempts: %s", email.pk, email.to, email.attempts, error)
+    else:
+        email.status = 'queued'
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+        logger.warning("Email %s to %s failed (attempt %s), retrying: %s", email.pk, email.to, email.attempts, error)
+    email.save(update_fields=['attempts', 'last_error', 'locked_at', 'status', 'next_attempt_at'])
+
+
+def send_batch(emails):
+    """Send ``emails`` over one reused connection; return how many went out."""
+    sent = 0
+    try:
+        connection = get_connection(DELIVERY_BACKEND)
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            mark_failed_attempt(email, e)
+        return 0
+
+    try:
+        for email in emails:
+            try:
+                build_message(email, connection).send()
+            except Exception as e:
+                mark_failed_attempt(email, e)
+                continue
+            QueuedEmail.objects.filter(pk=email.pk).update(
+                status='sent', sent_at=timezone.now(), locked_at=None, attempts=email.attempts + 1
+            )
+            sent += 1
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            logger.exception("Error closing mail connection")
+    return sent
+
+
+def deliver_due(batch_size=50):
+    """Claim and send one batch of due messages; return how many were claimed."""
+    emails = claim_batch(batch_size)
+    if emails:
+        sent = send_batch(emails)
+        logger.info("Mail queue batch: %s sent, %s deferred", sent, len(emails) - sent)
+    return len(emails)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from trading.analytics import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the hourly and daily sales rollups from every non-cancelled order.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        orders, rows = rebuild_sales_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {orders} orders into {rows} rows.'))
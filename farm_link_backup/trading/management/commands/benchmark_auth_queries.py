@@ -0,0 +1,55 @@
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+
+class Command(BaseCommand):
+    help = (
+        'Count the queries and time taken by registration, token login and a plain user save. '
+        'Creates throwaway users; run it against a development database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+
+    def measure(self, results, name, func):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = func()
+            elapsed = time.perf_counter() - started
+        if response is not None and response.status_code >= 400:
+            self.stderr.write(f'{name}: HTTP {response.status_code} {getattr(response, "data", "")}')
+        results.setdefault(name, []).append((len(queries), elapsed))
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        client = APIClient(HTTP_HOST='localhost')
+        run_id = uuid.uuid4().hex[:8]
+        password = 'Tractor-Pasture-4821'
+        emails = []
+        results = {}
+        try:
+            for n in range(options['iterations']):
+                email = f'bench-{run_id}-{n}@example.com'
+                emails.append(email)
+                self.measure(results, 'register', lambda: client.post(
+                    '/api/auth/users/', {'email': email, 'username': f'bench-{run_id}-{n}', 'password': password}
+                ))
+                self.measure(results, 'token login', lambda: client.post(
+                    '/api/auth/token/login/', {'email': email, 'password': password}
+                ))
+                user = User.objects.get(email=email)
+                user.first_name = 'Bench'
+                self.measure(results, 'user save', lambda: user.save())
+        finally:
+            User.objects.filter(email__in=emails).delete()
+
+        for name, samples in results.items():
+            counts = sorted({count for count, _ in samples})
+            avg_ms = sum(elapsed for _, elapsed in samples) / len(samples) * 1000
+            self.stdout.write(f'{name:<12} queries: {"/".join(map(str, counts)):<6} avg {avg_ms:.1f} ms')
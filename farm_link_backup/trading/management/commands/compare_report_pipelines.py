@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from trading.aggregations import order_totals, revenue_by_category, top_sellers
+
+REPORTS = {
+    'order_totals': lambda native, options: list(order_totals(native=native, using=options['database'])),
+    'revenue_by_category': lambda native, options: revenue_by_category(native=native, using=options['database']),
+    'top_sellers': lambda native, options: top_sellers(options['limit'], native=native, using=options['database']),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Time each report through the native MongoDB pipeline and the ORM and print the best run '
+        'of each. Whether the two agree is checked by the trading test suite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report', action='append', choices=sorted(REPORTS), help='Defaults to every report.')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per path; the fastest is reported.')
+        parser.add_argument('--limit', type=int, default=10, help='Rows for top_sellers.')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if connections[options['database']].vendor != 'djongo':
+            raise CommandError('Native pipelines need the djongo (MongoDB) database backend.')
+
+        self.stdout.write(f"{'report':<22}{'rows':>8}{'orm ms':>12}{'native ms':>12}{'speedup':>10}")
+        for name in options['report'] or sorted(REPORTS):
+            run = REPORTS[name]
+            orm_rows, orm_time = self.best_of(run, False, options)
+            _, native_time = self.best_of(run, True, options)
+            speedup = orm_time / native_time if native_time else float('inf')
+            self.stdout.write(
+                f'{name:<22}{len(orm_rows):>8}{orm_time * 1000:>12.1f}{native_time * 1000:>12.1f}{speedup:>9.1f}x'
+            )
+
+    def best_of(self, run, native, options):
+        best, rows = None, None
+        for _ in range(max(options['repeat'], 1)):
+            started = time.perf_counter()
+            rows = run(native, options)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return rows, best
@@ -0,0 +1,32 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from whitenoise.compress import Compressor
+
+
+class Command(BaseCommand):
+    help = 'Write precompressed .gz/.br copies of the built frontend bundle for WhiteNoise to serve.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=str(settings.FRONTEND_DIST_DIR),
+                            help='Directory produced by `npm run build`.')
+
+    def handle(self, *args, **options):
+        root = options['path']
+        if not os.path.isdir(root):
+            raise CommandError(f'{root} does not exist; run `npm run build` in marketplace-frontend first.')
+
+        compressor = Compressor(quiet=True)
+        paths = [
+            os.path.join(dirpath, filename)
+            for dirpath, _dirs, files in os.walk(root)
+            for filename in files
+            if compressor.should_compress(filename)
+        ]
+        with ThreadPoolExecutor() as pool:
+            written = sum(len(files) for files in pool.map(compressor.compress, paths))
+        if not compressor.use_brotli:
+            self.stdout.write(self.style.WARNING('Brotli is not installed; only gzip copies were written.'))
+        self.stdout.write(self.style.SUCCESS(f'Compressed {len(paths)} files ({written} compressed copies written).'))
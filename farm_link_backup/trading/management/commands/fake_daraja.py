@@ -0,0 +1,62 @@
+import json
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class FakeDarajaHandler(BaseHTTPRequestHandler):
+    """Answers the OAuth and STK push endpoints the way the Daraja sandbox does."""
+
+    token_requests = 0
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/oauth/v1/generate'):
+            FakeDarajaHandler.token_requests += 1
+            self._send_json(200, {'access_token': uuid.uuid4().hex, 'expires_in': '3599'})
+        else:
+            self._send_json(404, {'errorMessage': 'Not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if self.path != '/mpesa/stkpush/v1/processrequest':
+            self._send_json(404, {'errorMessage': 'Not found'})
+        elif not self.headers.get('Authorization', '').startswith('Bearer '):
+            self._send_json(401, {'errorMessage': 'Invalid Access Token'})
+        else:
+            self._send_json(200, {
+                'MerchantRequestID': uuid.uuid4().hex[:12],
+                'CheckoutRequestID': f'ws_CO_{uuid.uuid4().hex[:20]}',
+                'ResponseCode': '0',
+                'ResponseDescription': 'Success. Request accepted for processing',
+                'CustomerMessage': f"Success. Request accepted for processing ({payload.get('PhoneNumber')})",
+            })
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Run a local fake of the Daraja OAuth and STK push API (point MPESA_BASE_URL at it).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), FakeDarajaHandler)
+        self.stdout.write(f"Fake Daraja listening on http://127.0.0.1:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
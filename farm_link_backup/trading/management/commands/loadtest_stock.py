@@ -0,0 +1,94 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from trading.checkout import create_order_with_payment
+from trading.inventory import InsufficientStock, release_expired_holds, release_hold
+from trading.models import Category, Order, Product, StockHold
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent checkouts at one listing and verify it is never oversold. '
+        'Creates its own throwaway data; run it against a development database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=300)
+        parser.add_argument('--stock', type=int, default=5)
+        parser.add_argument('--workers', type=int, default=50)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated data.')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create_user(
+            email=f'loadtest-{run_id}@example.com', username=f'loadtest-{run_id}', password=None
+        )
+        category = Category.objects.create(name=f'Load test {run_id}')
+        product = Product.objects.create(
+            name=f'Load test animal {run_id}', description='Load test listing',
+            price=1, stock=options['stock'], category=category,
+        )
+        results = {'sold': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def buy(n):
+            data = {
+                'customer_name': f'Buyer {n}',
+                'customer_email': f'buyer{n}@example.com',
+                'phone_number': '254700000000',
+                'shipping_address': 'Load test',
+                'items': [{'product': product, 'quantity': 1}],
+            }
+            try:
+                create_order_with_payment(user, data)
+                outcome = 'sold'
+            except InsufficientStock:
+                outcome = 'rejected'
+            except Exception as e:
+                self.stderr.write(f'Buyer {n}: {e}')
+                outcome = 'errors'
+            finally:
+                connection.close()
+            with lock:
+                results[outcome] += 1
+
+        try:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                list(pool.map(buy, range(options['buyers'])))
+
+            product.refresh_from_db()
+            holds = StockHold.objects.filter(order__user=user, status='held').count()
+            self.stdout.write(
+                f"{options['buyers']} buyers, stock {options['stock']}: "
+                f"{results['sold']} sold, {results['rejected']} rejected, {results['errors']} errors; "
+                f"stock left {product.stock}, {holds} holds"
+            )
+            expected_sold = min(options['buyers'], options['stock'])
+            if results['sold'] != expected_sold or product.stock != options['stock'] - expected_sold:
+                raise CommandError('Oversold or lost stock under concurrency')
+            if holds != results['sold']:
+                raise CommandError('Hold count does not match sales')
+
+            # Failed payments and lapsed holds must hand the stock back exactly once
+            orders = list(Order.objects.filter(user=user))
+            for order in orders[::2]:
+                release_hold(order)
+                release_hold(order)
+            StockHold.objects.filter(order__user=user, status='held').update(expires_at=timezone.now())
+            release_expired_holds()
+            product.refresh_from_db()
+            if product.stock != options['stock']:
+                raise CommandError(f'Stock after releasing every hold is {product.stock}, expected {options["stock"]}')
+            self.stdout.write(self.style.SUCCESS('No overselling; all holds released cleanly.'))
+        finally:
+            if not options['keep']:
+                Order.objects.filter(user=user).delete()
+                product.delete()
+                category.delete()
+                user.delete()
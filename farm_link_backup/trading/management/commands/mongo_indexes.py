@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from trading.mongo_indexes import build_index, diff_indexes, index_usage, set_profiling, slow_operations
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the indexes declared on the models with the live MongoDB collections. '
+        '--build creates the missing ones in the background; --usage and --slow report '
+        'from $indexStats and the profiler.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--build', action='store_true', help='Create missing indexes.')
+        parser.add_argument('--usage', action='store_true', help='List indexes with no recorded use.')
+        parser.add_argument('--slow', type=int, metavar='MS', help='List profiled operations slower than MS.')
+        parser.add_argument('--limit', type=int, default=20, help='Rows for --slow.')
+        parser.add_argument(
+            '--profile', type=int, metavar='MS',
+            help='Turn on the profiler for operations slower than MS (-1 turns it off).',
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if connections[using].vendor != 'djongo':
+            raise CommandError('Index management needs the djongo (MongoDB) database backend.')
+
+        if options['profile'] is not None:
+            set_profiling(None if options['profile'] < 0 else options['profile'], using)
+            state = 'off' if options['profile'] < 0 else f"on for operations over {options['profile']} ms"
+            self.stdout.write(f'Profiler {state}.')
+
+        failures = self.sync(options['build'], using)
+        if options['usage']:
+            self.report_usage(using)
+        if options['slow'] is not None:
+            self.report_slow(options['slow'], options['limit'], using)
+        if failures:
+            raise CommandError(f'{failures} index build(s) failed.')
+
+    def sync(self, build, using):
+        missing_total, failures = 0, 0
+        for diff in diff_indexes(using):
+            for spec in diff.missing:
+                missing_total += 1
+                label = (
+                    f"{diff.collection}.{spec.name} {dict(spec.keys)}{' unique' if spec.unique else ''}"
+                    f"{f' where {spec.partial}' if spec.partial else ''}"
+                )
+                if not build:
+                    self.stdout.write(f'missing     {label}')
+                    continue
+                error = build_index(diff.collection, spec, using)
+                if error:
+                    failures += 1
+                    self.stderr.write(f'failed      {label}: {error}')
+                else:
+                    self.stdout.write(f'built       {label}')
+            for spec in diff.conflicting:
+                wanted = 'unique' if spec.unique else 'non-unique'
+                if spec.partial:
+                    wanted += f' where {spec.partial}'
+                self.stdout.write(
+                    f'conflicting {diff.collection}.{spec.name}: live index on {dict(spec.keys)} is not {wanted}'
+                )
+            for keys in diff.undeclared:
+                self.stdout.write(f'undeclared  {diff.collection} {dict(keys)}')
+
+        if not missing_total:
+            self.stdout.write(self.style.SUCCESS('Every declared index exists.'))
+        elif not build:
+            self.stdout.write(f'{missing_total} missing; run with --build to create them.')
+        return failures
+
+    def report_usage(self, using):
+        unused = [(name, index, since) for name, index, ops, since in index_usage(using) if not ops]
+        self.stdout.write(f'\n{len(unused)} index(es) unused since their counters started:')
+        for name, index, since in unused:
+            self.stdout.write(f'  {name}.{index} (since {since:%Y-%m-%d %H:%M})')
+
+    def report_slow(self, min_ms, limit, using):
+        operations = slow_operations(min_ms, limit, using)
+        self.stdout.write(f'\n{len(operations)} profiled operation(s) over {min_ms} ms:')
+        for op in operations:
+            plan = op.get('planSummary', '-')
+            flag = '  <- collection scan' if plan == 'COLLSCAN' else ''
+            self.stdout.write(
+                f"  {op['millis']:>6} ms  {op['op']:<8} {op['ns']:<40} {plan} "
+                f"keys={op.get('keysExamined', '-')} docs={op.get('docsExamined', '-')} "
+                f"returned={op.get('nreturned', '-')}{flag}"
+            )
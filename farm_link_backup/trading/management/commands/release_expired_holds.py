@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from trading.inventory import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Return stock held by checkouts whose payment never completed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=float, default=0,
+                            help='Repeat every N seconds instead of running once.')
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_holds()
+            self.stdout.write(f'Released {released} expired hold(s).')
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
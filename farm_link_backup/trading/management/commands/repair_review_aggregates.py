@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from trading.reviews import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute rating_count, rating_sum and the star histogram on every product from its reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted products without fixing them.')
+
+    def handle(self, *args, **options):
+        fixed = rebuild_rating_aggregates(dry_run=options['dry_run'])
+        verb = 'would be repaired' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f'{fixed} product(s) {verb}.'))
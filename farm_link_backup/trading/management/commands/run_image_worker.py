@@ -0,0 +1,37 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from trading.images import process_next
+
+
+class Command(BaseCommand):
+    help = 'Build thumbnail, card and detail variants for uploaded product images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds a worker sleeps when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue once and exit instead of polling forever.')
+
+    def worker(self, poll_interval, once):
+        try:
+            while True:
+                if not process_next():
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        self.stdout.write(f'Starting {workers} image worker(s)...')
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self.worker, options['poll_interval'], options['once']) for _ in range(workers)]
+            for future in futures:
+                future.result()
+        self.stdout.write(self.style.SUCCESS('Image queue drained.'))
@@ -0,0 +1,42 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from trading.mail import deliver_due
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbound email with a pool of worker threads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds a worker sleeps when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue once and exit instead of polling forever.')
+
+    def worker(self, batch_size, poll_interval, once):
+        try:
+            while True:
+                claimed = deliver_due(batch_size)
+                if not claimed:
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        self.stdout.write(f'Starting {workers} mail worker(s)...')
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self.worker, options['batch_size'], options['poll_interval'], options['once'])
+                for _ in range(workers)
+            ]
+            for future in futures:
+                future.result()
+        self.stdout.write(self.style.SUCCESS('Mail queue drained.'))
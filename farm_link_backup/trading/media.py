@@ -0,0 +1,121 @@
+"""
+Serve uploaded media with validators, cache headers and byte ranges.
+
+``django.views.static.serve`` is DEBUG-only and sends the whole file on
+every request. This view answers ``If-None-Match``/``If-Modified-Since``
+with 304, honours a single ``Range`` so interrupted downloads can resume,
+and marks content-hashed files (the generated image variants) immutable.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Variants are written as ``<stem>-<variant>.<12 hex digest>.<ext>``
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """Return ``(start, end)`` for a single satisfiable range, ``None`` to send the whole file."""
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Malformed or multi-range: serving the full file is always allowed
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def if_range_matches(request, etag, mtime):
+    """A ``Range`` only applies if ``If-Range`` (when sent) still names this version."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) <= since
+
+
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Not found")
+    if not os.path.isfile(full_path):
+        raise Http404("Not found")
+
+    stat = os.stat(full_path)
+    size = stat.st_size
+    etag = '"%x-%x"' % (stat.st_mtime_ns, size)
+    last_modified = http_date(stat.st_mtime)
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = last_modified
+        response['Accept-Ranges'] = 'bytes'
+        if HASHED_NAME_RE.search(path):
+            patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return finish(not_modified)
+
+    start, end = 0, size - 1
+    status = 200
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and size and if_range_matches(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return finish(response)
+        if byte_range:
+            (start, end), status = byte_range, 206
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    response = StreamingHttpResponse(
+        read_range(full_path, start, end),
+        status=status,
+        content_type=content_type or 'application/octet-stream',
+    )
+    response['Content-Length'] = end - start + 1 if size else 0
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return finish(response)
+
@@ -0,0 +1,27 @@
+# Generated by Django 3.1.12 on 2026-10-18 06:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0007_product_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='trading.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productsearchterm',
+            index=models.Index(fields=['term', 'product'], name='search_term_product_idx'),
+        ),
+    ]
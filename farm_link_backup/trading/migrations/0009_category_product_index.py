@@ -0,0 +1,23 @@
+# Generated by Django 3.1.12 on 2026-10-18 06:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0008_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryProductIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_ids', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='product_index', to='trading.category')),
+            ],
+        ),
+    ]
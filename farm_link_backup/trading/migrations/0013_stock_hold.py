@@ -0,0 +1,29 @@
+# Generated by Django 3.1.12 on 2026-10-18 06:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0012_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lines', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('held', 'Held'), ('committed', 'Committed'), ('released', 'Released')], default='held', max_length=10)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stock_hold', to='trading.order')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockhold',
+            index=models.Index(fields=['status', 'expires_at'], name='stockhold_expiry_idx'),
+        ),
+    ]
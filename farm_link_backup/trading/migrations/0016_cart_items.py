@@ -0,0 +1,58 @@
+# Generated by Django 3.1.12 on 2026-10-18 06:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_cart_lines(apps, schema_editor):
+    Cart = apps.get_model('trading', 'Cart')
+    CartItem = apps.get_model('trading', 'CartItem')
+    Product = apps.get_model('trading', 'Product')
+    existing = set(Product.objects.values_list('id', flat=True))
+    lines = []
+    for cart in Cart.objects.all():
+        quantities = {}
+        # Old carts hold whole product objects as sent by the frontend
+        for item in cart.items or []:
+            if not isinstance(item, dict):
+                continue
+            try:
+                product_id = int(item.get('product') or item.get('id'))
+                quantity = max(int(item.get('quantity') or 1), 1)
+            except (TypeError, ValueError):
+                continue
+            if product_id in existing:
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+        lines.extend(
+            CartItem(cart_id=cart.pk, product_id=product_id, quantity=quantity)
+            for product_id, quantity in quantities.items()
+        )
+    CartItem.objects.bulk_create(lines)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0015_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='trading.cart')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to='trading.product')),
+            ],
+            options={
+                'unique_together': {('cart', 'product')},
+            },
+        ),
+        migrations.RunPython(copy_cart_lines, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='cart',
+            name='items',
+        ),
+    ]
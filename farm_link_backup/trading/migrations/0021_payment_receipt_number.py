@@ -0,0 +1,18 @@
+# Generated by Django 3.1.12 on 2026-10-18 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0020_user_tokens_valid_after'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='receipt_number',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
@@ -1,9 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.db.models.functions import Coalesce
 from django.dispatch import receiver
 from django.conf import settings
+from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,7 +20,9 @@ class CustomUserManager(BaseUserManager):
         email = self.normalize_email(email)
         user = self.model(email=email, **extra_fields)
         user.set_password(password)
-        user.save(using=self._db)
+        with transaction.atomic(using=self._db, savepoint=False):
+            # post_save creates the profile in the same transaction
+            user.save(using=self._db)
         return user
 
     def create_superuser(self, email, password=None, **extra_fields):
@@ -37,15 +41,52 @@ class CustomUserManager(BaseUserManager):
 class CustomUser(AbstractUser):
     email = models.EmailField('email address', unique=True)
     username = models.CharField(max_length=150, unique=True, blank=False, null=False)
+    # JWTs issued before this are rejected on refresh; moved by any change to AUTH_STATE_FIELDS
+    tokens_valid_after = models.DateTimeField(null=True, blank=True)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
+    AUTH_STATE_FIELDS = ('password', 'is_active', 'is_staff', 'is_superuser', 'email', 'username')
 
     objects = CustomUserManager()
 
     def __str__(self):
         return self.email
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._auth_state = {f: instance.__dict__[f] for f in cls.AUTH_STATE_FIELDS if f in instance.__dict__}
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        # Loading a deferred field (e.g. on a user rebuilt from the token cache) is not a change
+        loaded = getattr(self, '_auth_state', None)
+        if loaded is not None:
+            for f in self.AUTH_STATE_FIELDS if fields is None else fields:
+                if f in self.AUTH_STATE_FIELDS and f in self.__dict__:
+                    loaded[f] = self.__dict__[f]
+
+    def auth_state_changed(self, update_fields=None):
+        """Whether this save changes a credential or a field copied into JWT claims."""
+        loaded = getattr(self, '_auth_state', None)
+        if loaded is None:
+            return False
+        fields = self.AUTH_STATE_FIELDS if update_fields is None else set(self.AUTH_STATE_FIELDS) & set(update_fields)
+        # A field that was deferred at load time and is now set counts as changed
+        return any(f in self.__dict__ and (f not in loaded or loaded[f] != self.__dict__[f]) for f in fields)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and self.auth_state_changed(update_fields):
+            self.tokens_valid_after = timezone.now()
+            self._revoke_tokens = True
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'tokens_valid_after'}
+        super().save(*args, **kwargs)
+        self._auth_state = {f: self.__dict__[f] for f in self.AUTH_STATE_FIELDS if f in self.__dict__}
+
 # ==================== CATEGORY ====================
 class Category(models.Model):
     name = models.CharField(max_length=255)
@@ -66,11 +107,171 @@ class Product(models.Model):
     last_vaccination_date = models.DateField(null=True, blank=True)
     health_certificate_url = models.URLField(null=True, blank=True)
     vet_verified_by = models.CharField(max_length=255, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # {variant: {format: storage path}}, filled in by the image worker
+    image_variants = models.JSONField(default=dict, blank=True)
+    # Review aggregates, kept in step by add_review and repair_review_aggregates
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
 
+    @property
+    def rating_average(self):
+        return round(self.rating_sum / self.rating_count, 2) if self.rating_count else None
+
+    @property
+    def rating_histogram(self):
+        return {str(star): getattr(self, f'rating_{star}_count') for star in range(1, 6)}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored category so a move can refresh both related-product indexes
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        # ...and the stored image, so only a new upload queues variant generation
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+            models.Index(fields=['is_vaccinated'], name='product_vaccinated_idx'),
+            models.Index(fields=['stock'], name='product_stock_idx'),
+            models.Index(fields=['name'], name='product_name_idx'),
+        ]
+
+# ==================== RESPONSE CACHE INVALIDATION ====================
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_responses(sender, **kwargs):
+    from .response_cache import invalidate
+    invalidate('products')
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_responses(sender, **kwargs):
+    from .response_cache import invalidate
+    # Product search hits and filters by category name depend on categories too
+    invalidate('categories', 'products')
+
+# ==================== PRODUCT SEARCH INDEX ====================
+class ProductSearchTerm(models.Model):
+    """One posting in the inverted index used by the product search endpoint."""
+    term = models.CharField(max_length=100)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'product'], name='search_term_product_idx'),
+        ]
+
+@receiver(post_save, sender=Product)
+def index_product_for_search(sender, instance, **kwargs):
+    from .search import index_product
+    index_product(instance)
+
+@receiver(post_save, sender=Category)
+def reindex_category_for_search(sender, instance, created, **kwargs):
+    if not created:
+        from .search import index_category
+        index_category(instance)
+
+# ==================== RELATED PRODUCTS INDEX ====================
+class CategoryProductIndex(models.Model):
+    """Precomputed, newest-first list of in-stock product IDs for one category."""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, related_name='product_index')
+    product_ids = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Product index for {self.category.name}"
+
+@receiver(post_save, sender=Product)
+def refresh_related_index_on_save(sender, instance, **kwargs):
+    from .related import refresh_category_index
+    refresh_category_index(instance.category_id)
+    previous = getattr(instance, '_loaded_category_id', None)
+    if previous is not None and previous != instance.category_id:
+        refresh_category_index(previous)
+    instance._loaded_category_id = instance.category_id
+
+@receiver(post_delete, sender=Product)
+def refresh_related_index_on_delete(sender, instance, **kwargs):
+    from .related import refresh_category_index
+    refresh_category_index(instance.category_id)
+
+# ==================== PRODUCT IMAGE VARIANTS ====================
+class ImageJob(models.Model):
+    """Queued request to build resized variants of a product's uploaded image."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='image_jobs')
+    source = models.CharField(max_length=255)  # image name the job was queued for
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Image job for {self.source} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='imagejob_status_idx'),
+        ]
+
+@receiver(post_save, sender=Product)
+def queue_image_variants(sender, instance, **kwargs):
+    from .images import discard_variants, variant_files
+    image_name = instance.image.name if instance.image else ''
+    if image_name != str(getattr(instance, '_loaded_image', '') or ''):
+        # The old variants belong to the old image; clients fall back to the original until the job runs
+        with transaction.atomic():
+            stale = Product.objects.filter(pk=instance.pk).values_list('image_variants', flat=True).first()
+            Product.objects.filter(pk=instance.pk, image=image_name).update(image_variants={})
+            if image_name:
+                ImageJob.objects.create(product=instance, source=image_name)
+            discard_variants(variant_files(stale))
+        instance.image_variants = {}
+    instance._loaded_image = image_name
+
+@receiver(post_delete, sender=Product)
+def delete_image_variant_files(sender, instance, **kwargs):
+    from .images import discard_variants, variant_files
+    discard_variants(variant_files(instance.image_variants))
+
 # ==================== ORDER ====================
+class OrderQuerySet(models.QuerySet):
+    def with_details(self):
+        """Load users, items and their products in bulk for serialization."""
+        return self.select_related('user').prefetch_related('items__product')
+
+    def with_totals(self):
+        """Annotate each order with ``total``, the sum of quantity * unit price over its items."""
+        return self.annotate(total=models.Sum(
+            models.F('items__quantity') * Coalesce('items__unit_price', 'items__product__price'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ))
+
+    def summaries(self):
+        """Load only the columns the order list views display."""
+        return self.select_related('user').only(
+            'id', 'customer_name', 'customer_email', 'status', 'created_at', 'user__email'
+        )
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -92,16 +293,56 @@ class Order(models.Model):
     customer_email = models.EmailField()
     shipping_address = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
 
+    objects = OrderQuerySet.as_manager()
+
     def __str__(self):
         return f"Order #{self.id} - {self.customer_name}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at'], name='order_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            models.Index(fields=['customer_email'], name='order_customer_email_idx'),
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ]
+
 # ==================== ORDER ITEM ====================
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    # Price when the order was placed; null for orders that predate it
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+# ==================== SALES ROLLUPS ====================
+class SalesRollup(models.Model):
+    """Orders, units and revenue for one hour or day, for the whole shop, a category or a product."""
+    GRANULARITY_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    SCOPE_CHOICES = [
+        ('total', 'All sales'),
+        ('category', 'Category'),
+        ('product', 'Product'),
+    ]
+
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    scope = models.CharField(max_length=8, choices=SCOPE_CHOICES)
+    key = models.PositiveIntegerField(default=0)  # category or product id; 0 for the total
+    bucket = models.DateTimeField()  # start of the hour/day, UTC
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('granularity', 'scope', 'key', 'bucket')
+
+    def __str__(self):
+        return f"{self.scope} {self.key} {self.granularity} {self.bucket:%Y-%m-%d %H:00}"
 
 # ==================== USER PROFILE ====================
 class UserProfile(models.Model):
@@ -115,36 +356,86 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"Profile for {self.user.email}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def changed_fields(self):
+        loaded = getattr(self, '_loaded_values', {})
+        return [
+            f.attname for f in self._meta.concrete_fields
+            if f.attname in loaded and getattr(self, f.attname) != loaded[f.attname]
+        ]
+
+    def save(self, *args, **kwargs):
+        # Write only the columns that changed since the profile was loaded
+        if not self._state.adding and kwargs.get('update_fields') is None and hasattr(self, '_loaded_values'):
+            changed = self.changed_fields()
+            if not changed:
+                return
+            kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        self._loaded_values = {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields}
+
     class Meta:
         verbose_name = 'User Profile'
         verbose_name_plural = 'User Profiles'
 
 # ==================== PROFILE SIGNALS ====================
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created and not hasattr(instance, 'profile'):
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    # Runs inside the user's INSERT transaction; later user saves never touch the profile
+    if created and not raw:
         UserProfile.objects.create(user=instance)
-        logger.info(f"[✔] Profile created for: {instance.email}")
-    else:
-        logger.info(f"[ℹ] Profile already exists for: {instance.email}")
+        logger.debug("Profile created for: %s", instance.email)
+
+# ==================== AUTH TOKEN CACHE ====================
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    # Deactivation and role/email changes must not be served from a cached user;
+    # the last_login bump on every login changes nothing a request relies on
+    if not created and update_fields != frozenset({'last_login'}):
+        from .authentication import invalidate_user_tokens
+        invalidate_user_tokens(instance)
+
+@receiver(post_delete, sender='authtoken.Token')
+def invalidate_cached_token(sender, instance, **kwargs):
+    # Logout (djoser token/logout/) deletes the token
+    from .authentication import invalidate_token
+    invalidate_token(instance.key)
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
-def save_user_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
-        logger.info(f"[🛠] Profile saved for: {instance.email}")
-    else:
-        logger.warning(f"[⚠] Tried to save profile, but none exists for: {instance.email}")
+def revoke_jwts_on_auth_change(sender, instance, created, **kwargs):
+    # Password, activation, role and claim changes (see CustomUser.save) end every JWT issued before them
+    if getattr(instance, '_revoke_tokens', False):
+        instance._revoke_tokens = False
+        if settings.JWT_AUTH_ENABLED:
+            from .jwt_auth import revoke_user_tokens
+            revoke_user_tokens(instance.pk)
 
 # ==================== CART ====================
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cart')
-    items = models.JSONField(default=list)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Cart for {self.user.email}"
 
+class CartItem(models.Model):
+    """One cart line; each add/update/remove touches only its own row."""
+    cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='cart_items', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('cart', 'product')
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} in cart {self.cart_id}"
+
 # ==================== REVIEW ====================
 class Review(models.Model):
     product = models.ForeignKey(Product, related_name='reviews', on_delete=models.CASCADE)
@@ -159,13 +450,101 @@ class Review(models.Model):
     class Meta:
         unique_together = ('product', 'user')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', '-created_at'], name='review_product_created_idx'),
+        ]
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_aggregates(sender, instance, **kwargs):
+    from .reviews import apply_rating
+    apply_rating(instance.product_id, instance.rating, -1)
+
+# ==================== OUTBOUND EMAIL QUEUE ====================
+class QueuedEmail(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.TextField()
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list)
+    bcc = models.JSONField(default=list)
+    reply_to = models.JSONField(default=list)
+    headers = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='queuedemail_due_idx'),
+        ]
 
 # ==================== PAYMENT ====================
 class Payment(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     order = models.ForeignKey('Order', on_delete=models.CASCADE, null=True, blank=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    status = models.CharField(max_length=20)  # e.g., 'pending', 'completed'
+    status = models.CharField(max_length=20)  # e.g., 'pending', 'completed', 'refund_due'
     transaction_id = models.CharField(max_length=100, blank=True, null=True)
+    receipt_number = models.CharField(max_length=50, blank=True, null=True)  # M-Pesa's MpesaReceiptNumber
     payment_method = models.CharField(max_length=50, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # mpesa_callback finds the payment by Daraja's CheckoutRequestID
+            models.Index(fields=['transaction_id'], name='payment_transaction_idx'),
+            models.Index(fields=['user', '-created_at'], name='payment_user_created_idx'),
+        ]
+
+# ==================== STOCK HOLDS ====================
+class StockHold(models.Model):
+    """Stock reserved for an order while its M-Pesa payment is pending."""
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+    ]
+
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='stock_hold')
+    lines = models.JSONField(default=list)  # [[product_id, quantity], ...]
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Stock hold for order #{self.order_id} ({self.status})"
+
+    @property
+    def quantities(self):
+        return {product_id: quantity for product_id, quantity in self.lines}
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='stockhold_expiry_idx'),
+        ]
+
+# ==================== CHECKOUT IDEMPOTENCY ====================
+class IdempotencyKey(models.Model):
+    """Remembers which order a client-supplied checkout key produced."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=64)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='idempotency_keys')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
@@ -0,0 +1,180 @@
+"""
+Keep MongoDB's secondary indexes in step with the models.
+
+With ``ENFORCE_SCHEMA: False`` djongo's migrations create few of the indexes
+the models declare. The models stay the single place indexes are declared:
+``required_indexes()`` reads every ``Meta.indexes`` entry, every
+``unique_together`` and unique field, and every ``db_index`` field
+(foreign keys included) and turns them into MongoDB key patterns. A
+single-field index is left out when a compound index already starts with
+that field, since the compound one serves the same lookups.
+
+MongoDB treats null and missing values as equal, so a unique index over a
+nullable field (``Product.tag_number``) would reject a second null. Such
+indexes are declared partial and only cover documents where the field
+holds a value of its type.
+
+``diff_indexes()`` compares those against ``index_information()`` on the
+live collections by key pattern, and ``build_index()`` creates the missing
+ones in the background. ``index_usage()`` and ``slow_operations()`` read
+``$indexStats`` and the database profiler to show which indexes go unused
+and which queries are slow. ``manage.py mongo_indexes`` drives all of it.
+"""
+from collections import namedtuple
+
+from django.apps import apps
+from pymongo.errors import OperationFailure
+
+from .aggregations import database
+
+IndexSpec = namedtuple('IndexSpec', 'name keys unique partial')
+IndexDiff = namedtuple('IndexDiff', 'collection missing conflicting undeclared')
+
+
+def column(model, field_name):
+    return model._meta.get_field(field_name).column
+
+
+def index_keys(model, fields):
+    """Django index fields (``'-created_at'`` for descending) as a MongoDB key pattern."""
+    keys = []
+    for field_name in fields:
+        direction = -1 if field_name.startswith('-') else 1
+        keys.append((column(model, field_name.lstrip('-')), direction))
+    return tuple(keys)
+
+
+BSON_TYPES = {
+    'CharField': 'string', 'EmailField': 'string', 'SlugField': 'string', 'TextField': 'string',
+    'URLField': 'string', 'FileField': 'string', 'ImageField': 'string', 'UUIDField': 'string',
+    'DateField': 'date', 'DateTimeField': 'date', 'DecimalField': 'decimal', 'BooleanField': 'bool',
+}
+
+
+def bson_type(field):
+    field = getattr(field, 'target_field', None) or field
+    return BSON_TYPES.get(field.get_internal_type(), 'number')
+
+
+def unique_filter(model, field_names):
+    """``partialFilterExpression`` that keeps nulls out of a unique index, or ``None`` if no field is nullable."""
+    fields = [model._meta.get_field(name) for name in field_names]
+    expression = {field.column: {'$type': bson_type(field)} for field in fields if field.null}
+    return expression or None
+
+
+def model_indexes(model):
+    table = model._meta.db_table
+    specs = []
+    for index in model._meta.indexes:
+        specs.append(IndexSpec(index.name, index_keys(model, index.fields), False, None))
+    for fields in model._meta.unique_together:
+        keys = index_keys(model, fields)
+        specs.append(IndexSpec(f"{table}_{'_'.join(k for k, _ in keys)}_uniq", keys, True, unique_filter(model, fields)))
+    for field in model._meta.local_concrete_fields:
+        if field.unique:
+            specs.append(IndexSpec(
+                f'{table}_{field.column}_uniq', ((field.column, 1),), True, unique_filter(model, [field.name]),
+            ))
+        elif field.db_index:
+            specs.append(IndexSpec(f'{table}_{field.column}_idx', ((field.column, 1),), False, None))
+
+    # A plain single-field index adds write cost but nothing a compound index starting with it can't do
+    prefixes = {spec.keys[0][0] for spec in specs if len(spec.keys) > 1}
+    return [
+        spec for spec in specs
+        if spec.unique or len(spec.keys) > 1 or spec.keys[0][0] not in prefixes
+    ]
+
+
+def required_indexes():
+    """``{collection name: [IndexSpec, ...]}`` for every managed model."""
+    required = {}
+    for model in apps.get_models(include_auto_created=True):
+        if model._meta.managed and not model._meta.proxy:
+            specs = model_indexes(model)
+            if specs:
+                required.setdefault(model._meta.db_table, []).extend(specs)
+    return required
+
+
+def key_pattern(key):
+    # Older shells stored directions as floats; special indexes use strings such as 'text'
+    return tuple((field, direction if isinstance(direction, str) else int(direction)) for field, direction in key)
+
+
+def partial_filter(info):
+    expression = info.get('partialFilterExpression')
+    return key_filter(expression) if expression else None
+
+
+def key_filter(expression):
+    # index_information() returns SON documents; compare as plain dicts
+    return {key: key_filter(value) if isinstance(value, dict) else value for key, value in expression.items()}
+
+
+def diff_indexes(using='default'):
+    """Yield an :class:`IndexDiff` for each collection whose indexes don't match the declarations."""
+    db = database(using)
+    for name, specs in sorted(required_indexes().items()):
+        live = {
+            key_pattern(info['key']): info
+            for index_name, info in db[name].index_information().items()
+            if index_name != '_id_'
+        }
+        missing, conflicting = [], []
+        for spec in specs:
+            info = live.get(spec.keys)
+            if info is None:
+                missing.append(spec)
+            elif bool(info.get('unique')) != spec.unique or partial_filter(info) != spec.partial:
+                conflicting.append(spec)
+        declared = {spec.keys for spec in specs}
+        undeclared = [keys for keys in live if keys not in declared]
+        if missing or conflicting or undeclared:
+            yield IndexDiff(name, missing, conflicting, undeclared)
+
+
+def build_index(collection_name, spec, using='default'):
+    """
+    Create one index without blocking the collection.
+
+    Returns an error message instead of raising, e.g. when existing documents
+    break a unique index or an index of the same name has other keys.
+    """
+    try:
+        options = {'partialFilterExpression': spec.partial} if spec.partial else {}
+        database(using)[collection_name].create_index(
+            list(spec.keys), name=spec.name, unique=spec.unique, background=True, **options,
+        )
+    except OperationFailure as e:
+        return str(e)
+    return None
+
+
+# ==================== PROFILER ====================
+def index_usage(using='default'):
+    """Yield ``(collection, index name, operations, counting since)`` for every index on a declared collection."""
+    db = database(using)
+    for name in sorted(required_indexes()):
+        for stats in db[name].aggregate([{'$indexStats': {}}]):
+            if stats['name'] != '_id_':
+                yield name, stats['name'], stats['accesses']['ops'], stats['accesses']['since']
+
+
+def set_profiling(slow_ms, using='default'):
+    """Record operations slower than ``slow_ms`` in ``system.profile`` (``None`` turns profiling off)."""
+    db = database(using)
+    if slow_ms is None:
+        return db.command('profile', 0)
+    return db.command('profile', 1, slowms=slow_ms)
+
+
+def slow_operations(min_ms=100, limit=20, using='default'):
+    """The slowest profiled operations, with the plan each one used."""
+    profile = database(using)['system.profile']
+    operations = profile.find(
+        {'millis': {'$gte': min_ms}},
+        {'ns': 1, 'op': 1, 'millis': 1, 'planSummary': 1, 'keysExamined': 1, 'docsExamined': 1, 'nreturned': 1, 'ts': 1},
+    ).sort('millis', -1).limit(limit)
+    return list(operations)
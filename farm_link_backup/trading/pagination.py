@@ -0,0 +1,39 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+# ==================== PRODUCTS ====================
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the product catalog.
+
+    The cursor encodes the last seen sort key, so every page is a bounded,
+    index-backed range scan no matter how deep the client pages.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+
+
+class SearchResultsPagination(PageNumberPagination):
+    """Search hits are ranked by score, so they page by position instead of by key."""
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+# ==================== ORDERS ====================
+class OrderCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = '-created_at'
+
+
+# ==================== REVIEWS ====================
+class ReviewCursorPagination(CursorPagination):
+    """Newest reviews first, walked along the (product, -created_at) index."""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    ordering = ('-created_at', '-id')
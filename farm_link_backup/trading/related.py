@@ -0,0 +1,58 @@
+from collections import Counter
+
+from .models import CategoryProductIndex, OrderItem, Product
+
+# How many listings each per-category index keeps, newest first
+INDEX_SIZE = 200
+# How many recent orders of a product are mined for co-purchases
+CO_PURCHASE_ORDER_LIMIT = 500
+
+
+def refresh_category_index(category_id):
+    if category_id is None:
+        return []
+    product_ids = list(
+        Product.objects.filter(category_id=category_id, stock__gt=0)
+        .order_by('-id')
+        .values_list('id', flat=True)[:INDEX_SIZE]
+    )
+    CategoryProductIndex.objects.update_or_create(
+        category_id=category_id, defaults={'product_ids': product_ids}
+    )
+    return product_ids
+
+
+def category_product_ids(category_id):
+    index = CategoryProductIndex.objects.filter(category_id=category_id).first()
+    if index is None:
+        return refresh_category_index(category_id)
+    return index.product_ids
+
+
+def co_purchase_counts(product_id, candidate_ids):
+    order_ids = list(
+        OrderItem.objects.filter(product_id=product_id)
+        .order_by('-order_id')
+        .values_list('order_id', flat=True)[:CO_PURCHASE_ORDER_LIMIT]
+    )
+    if not order_ids:
+        return Counter()
+    return Counter(
+        OrderItem.objects.filter(order_id__in=order_ids, product_id__in=candidate_ids)
+        .values_list('product_id', flat=True)
+    )
+
+
+def related_product_ids(product, limit, rank=None):
+    """
+    Return up to ``limit`` IDs of listings related to ``product``.
+
+    Candidates come from the precomputed index of its category. With
+    ``rank='co_purchase'`` they are reordered by how often they were bought
+    in the same order as ``product``; ties keep the newest-first order.
+    """
+    candidates = [pk for pk in category_product_ids(product.category_id) if pk != product.pk]
+    if rank == 'co_purchase' and candidates:
+        counts = co_purchase_counts(product.pk, candidates)
+        candidates.sort(key=lambda pk: -counts[pk])
+    return candidates[:limit]
@@ -0,0 +1,99 @@
+import csv
+import tempfile
+
+from django.http import FileResponse, StreamingHttpResponse
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+# Rows fetched per database round trip while a report streams
+REPORT_CHUNK_SIZE = 2000
+# PDFs larger than this spill from memory to a temporary file
+PDF_SPOOL_SIZE = 1024 * 1024
+
+
+class Echo:
+    """File-like object whose ``write`` hands the value back instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+# ==================== CSV ====================
+def csv_streaming_response(filename, header, rows):
+    """
+    Stream ``rows`` to the client as a CSV attachment.
+
+    ``rows`` should be lazy (e.g. built over ``QuerySet.iterator()``) so
+    memory stays flat no matter how many rows the report has.
+    """
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# ==================== PDF ====================
+class PdfTable:
+    """
+    Lay out rows as a simple table on a reportlab canvas.
+
+    ``columns`` is a list of ``(heading, x)`` pairs. Rows are drawn top to
+    bottom; when a page fills up it is emitted and the column headings are
+    repeated on the next one.
+    """
+    title_font = ('Helvetica-Bold', 16)
+    body_font = ('Helvetica', 12)
+    row_height = 20
+    top_margin = 50
+    bottom_margin = 50
+
+    def __init__(self, pdf, columns, title=None, pagesize=letter):
+        self.pdf = pdf
+        self.columns = columns
+        self.title = title
+        self.width, self.height = pagesize
+        self.y = None
+
+    def _start_page(self, with_title):
+        self.y = self.height - self.top_margin
+        if with_title and self.title:
+            self.pdf.setFont(*self.title_font)
+            self.pdf.drawString(self.columns[0][1], self.y, self.title)
+            self.y -= 40
+        self.pdf.setFont(*self.body_font)
+        self._draw_cells(heading for heading, _ in self.columns)
+
+    def _draw_cells(self, values):
+        for value, (_, x) in zip(values, self.columns):
+            self.pdf.drawString(x, self.y, str(value))
+        self.y -= self.row_height
+
+    def draw(self, rows):
+        self._start_page(with_title=True)
+        for row in rows:
+            if self.y < self.bottom_margin:
+                self.pdf.showPage()
+                self._start_page(with_title=False)
+            self._draw_cells(row)
+
+
+def pdf_table_response(filename, columns, rows, title=None):
+    """
+    Render ``rows`` with :class:`PdfTable` and send the PDF as an attachment.
+
+    reportlab finishes a PDF only at ``save()``, so the document is spooled to
+    a temporary file that spills to disk past ``PDF_SPOOL_SIZE``. The response
+    then streams it back to the client in chunks.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_SIZE)
+    pdf = canvas.Canvas(buffer, pagesize=letter)
+    PdfTable(pdf, columns, title=title).draw(rows)
+    pdf.save()
+    buffer.seek(0)
+    return FileResponse(buffer, as_attachment=True, filename=filename, content_type='application/pdf')
@@ -0,0 +1,172 @@
+"""
+Response cache for public read endpoints.
+
+Serialized response data is stored in the Django cache under a key made of
+the namespace, its current version, the action, the URL kwargs, the host
+and the sorted query string. A write replaces the namespace version with a
+fresh random token, which orphans every older entry at once and records
+when the namespace last changed. The version and that time are also the
+ETag and Last-Modified validators, so conditional requests get a 304 before
+the cache entry or the database is read. Because versions are random
+rather than counters, a version lost to a restart or eviction can never
+come back and validate an old ETag.
+
+Last-Modified only has whole-second precision, so each write moves the
+namespace's time forward by at least a second. Two writes in the same
+second still give different Last-Modified values, and a client that only
+sends If-Modified-Since can't get a 304 for a body that changed. When a
+request carries both validators, If-None-Match wins (RFC 7232 section 6)
+and the exact ETag decides.
+
+The backend comes from ``CACHES[RESPONSE_CACHE_ALIAS]``: local memory by
+default, Redis when ``REDIS_URL`` is set. Local memory is per process, so
+invalidations don't reach other workers; ``check_shared_cache`` warns
+about that outside DEBUG.
+"""
+import functools
+import hashlib
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+CACHE_ALIAS = getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def version_key(namespace):
+    return f'response-cache:{namespace}:version'
+
+
+def modified_key(namespace):
+    return f'response-cache:{namespace}:modified'
+
+
+def new_version():
+    return uuid.uuid4().hex
+
+
+def namespace_version(namespace):
+    cache = get_cache()
+    version = cache.get(version_key(namespace))
+    if version is None:
+        version = new_version()
+        cache.add(version_key(namespace), version, timeout=None)
+        version = cache.get(version_key(namespace), version)
+    return version
+
+
+def namespace_last_modified(namespace):
+    cache = get_cache()
+    cache.add(modified_key(namespace), int(time.time()), timeout=None)
+    return cache.get(modified_key(namespace))
+
+
+def invalidate(*namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        cache.set(version_key(namespace), new_version(), timeout=None)
+        previous = cache.get(modified_key(namespace), 0)
+        cache.set(modified_key(namespace), max(int(time.time()), previous + 1), timeout=None)
+
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """Registered in ``TradingConfig.ready``: invalidations only reach every worker through a shared cache."""
+    backend = settings.CACHES.get(CACHE_ALIAS, {}).get('BACKEND')
+    if settings.DEBUG or backend not in PROCESS_LOCAL_BACKENDS:
+        return []
+    return [checks.Warning(
+        f"RESPONSE_CACHE_ALIAS '{CACHE_ALIAS}' uses {backend}, which is private to each process.",
+        hint='Set REDIS_URL (or another shared cache) so invalidations reach every worker.',
+        id='trading.W001',
+    )]
+
+
+def freeze(data):
+    """Turn serializer output into plain, picklable JSON types."""
+    return json.loads(json.dumps(data, cls=JSONEncoder))
+
+
+# ==================== VIEW MIXIN ====================
+def cached(method):
+    """Serve a viewset action through :meth:`CachedResponseMixin.cached_response`."""
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        return self.cached_response(lambda: method(self, request, *args, **kwargs), request)
+    return wrapper
+
+
+class CachedResponseMixin:
+    """
+    Cache ``list`` and ``retrieve`` (plus any action decorated with
+    :func:`cached`) under ``cache_namespace``.
+
+    Entries are shared by every caller who sends the same URL, so only use
+    this for responses that don't depend on the user.
+    """
+    cache_namespace = None
+
+    def cache_key(self, request, version):
+        query = sorted(request.query_params.lists())
+        raw = json.dumps([self.action, sorted(self.kwargs.items()), request.get_host(), query])
+        digest = hashlib.sha1(raw.encode()).hexdigest()
+        return f'response-cache:{self.cache_namespace}:{version}:{digest}', digest
+
+    def cached_response(self, render, request):
+        if request.method not in ('GET', 'HEAD'):
+            return render()
+
+        version = namespace_version(self.cache_namespace)
+        last_modified = namespace_last_modified(self.cache_namespace)
+        key, digest = self.cache_key(request, version)
+        etag = f'"{self.cache_namespace}-{version}-{digest[:16]}"'
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            # A 304 repeats the validators and caching rules the 200 would have carried
+            not_modified['ETag'] = etag
+            not_modified['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(not_modified, no_cache=True)
+            return not_modified
+
+        cache = get_cache()
+        data = cache.get(key)
+        if data is None:
+            response = render()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cache.set(key, freeze(response.data), CACHE_TIMEOUT)
+            response['X-Cache'] = 'MISS'
+        else:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Browsers keep the body and revalidate it with the validators above
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    @cached
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
@@ -0,0 +1,71 @@
+"""
+Review aggregates denormalized onto ``Product``.
+
+``rating_count``, ``rating_sum`` and ``rating_<n>_count`` let list cards show
+an average and a star histogram without reading any reviews. Writes apply
+``F()`` increments in the same transaction as the review itself, so
+concurrent reviews can't lose updates. ``rebuild_rating_aggregates`` (used
+by ``manage.py repair_review_aggregates``) recomputes them from the reviews.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import Product, Review
+from .response_cache import invalidate
+
+STARS = range(1, 6)
+
+
+def apply_rating(product_id, rating, sign=1):
+    """Add (``sign=1``) or remove (``sign=-1``) one ``rating`` from the product's aggregates."""
+    if rating not in STARS:
+        return
+    changes = {
+        'rating_count': F('rating_count') + sign,
+        'rating_sum': F('rating_sum') + sign * rating,
+        f'rating_{rating}_count': F(f'rating_{rating}_count') + sign,
+    }
+    queryset = Product.objects.filter(pk=product_id)
+    if sign < 0:
+        # Never drive a counter below zero if the aggregates were already out of step
+        queryset = queryset.filter(rating_count__gt=0, rating_sum__gte=rating, **{f'rating_{rating}_count__gt': 0})
+    if queryset.update(updated_at=timezone.now(), **changes):
+        invalidate('products')
+
+
+def create_review(serializer, user, product):
+    """Save a validated ``ReviewSerializer`` and count it, all or nothing."""
+    with transaction.atomic():
+        review = serializer.save(user=user, product=product)
+        apply_rating(product.pk, review.rating)
+    return review
+
+
+def rebuild_rating_aggregates(dry_run=False):
+    """Recompute every product's aggregates from its reviews; return how many were wrong."""
+    stats = {
+        row['product']: row
+        for row in Review.objects.order_by().values('product').annotate(
+            count=Count('id'),
+            total=Sum('rating'),
+            **{f'stars_{star}': Count('id', filter=Q(rating=star)) for star in STARS},
+        )
+    }
+    fixed = 0
+    fields = ['rating_count', 'rating_sum'] + [f'rating_{star}_count' for star in STARS]
+    for product in Product.objects.only('id', *fields).iterator():
+        row = stats.get(product.pk, {})
+        expected = {
+            'rating_count': row.get('count', 0),
+            'rating_sum': row.get('total') or 0,
+            **{f'rating_{star}_count': row.get(f'stars_{star}', 0) for star in STARS},
+        }
+        if all(getattr(product, name) == value for name, value in expected.items()):
+            continue
+        fixed += 1
+        if not dry_run:
+            Product.objects.filter(pk=product.pk).update(updated_at=timezone.now(), **expected)
+    if fixed and not dry_run:
+        invalidate('products')
+    return fixed
@@ -0,0 +1,189 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+
+from .models import Product, ProductSearchTerm
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MIN_TOKEN_LENGTH = 2
+MAX_QUERY_TERMS = 8
+# Shorter trailing terms match whole words only; "co" as a prefix would read half the index
+MIN_PREFIX_LENGTH = 3
+# Candidate IDs sent per ``product_id IN (...)`` query when narrowing by a further term
+CANDIDATE_BATCH_SIZE = 1000
+# The catalog size only feeds idf, so a slightly stale count is fine
+PRODUCT_COUNT_TIMEOUT = 5 * 60
+
+# Matches in the name or tag number matter more than in the description
+FIELD_WEIGHTS = {
+    'name': 3,
+    'tag_number': 3,
+    'category': 2,
+    'description': 1,
+}
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) >= MIN_TOKEN_LENGTH]
+
+
+def product_terms(product):
+    """Return a ``{term: weight}`` mapping for one product."""
+    fields = {
+        'name': product.name,
+        'tag_number': product.tag_number,
+        'category': product.category.name if product.category_id else '',
+        'description': product.description,
+    }
+    weights = Counter()
+    for field, text in fields.items():
+        for token in tokenize(text):
+            weights[token] += FIELD_WEIGHTS[field]
+    if product.tag_number:
+        # Let buyers paste a full tag like "KE-0042" and still hit it
+        weights[re.sub(r'\W+', '', product.tag_number.lower())] += FIELD_WEIGHTS['tag_number']
+    return weights
+
+
+# ==================== INDEXING ====================
+def index_product(product):
+    ProductSearchTerm.objects.filter(product_id=product.pk).delete()
+    ProductSearchTerm.objects.bulk_create([
+        ProductSearchTerm(term=term, product_id=product.pk, weight=weight)
+        for term, weight in product_terms(product).items()
+    ])
+
+
+def index_category(category):
+    for product in Product.objects.filter(category=category).select_related('category'):
+        index_product(product)
+
+
+def rebuild_index(batch_size=1000):
+    ProductSearchTerm.objects.all().delete()
+    count = 0
+    batch = []
+    for product in Product.objects.select_related('category').iterator(chunk_size=batch_size):
+        batch.extend(
+            ProductSearchTerm(term=term, product_id=product.pk, weight=weight)
+            for term, weight in product_terms(product).items()
+        )
+        count += 1
+        if len(batch) >= batch_size:
+            ProductSearchTerm.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        ProductSearchTerm.objects.bulk_create(batch)
+    return count
+
+
+# ==================== QUERYING ====================
+class RankedIds:
+    """
+    Matching product IDs, best match first, ranked only as far as they are read.
+
+    Paginators take ``len()`` for the count and slice out one page, so a
+    slice ending at ``stop`` runs ``heapq.nlargest(stop)`` instead of sorting
+    every match.
+    """
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    def rank(self, pk):
+        return self.scores[pk], pk
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __iter__(self):
+        return iter(sorted(self.scores, key=self.rank, reverse=True))
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return list(self)[index]
+        stop = len(self) if index.stop is None or index.stop < 0 else index.stop
+        return heapq.nlargest(stop, self.scores, key=self.rank)[index.start:index.stop:index.step]
+
+
+def term_lookup(term, prefix):
+    return {'term__startswith': term} if prefix else {'term': term}
+
+
+def document_frequency(term, prefix):
+    """How many products contain ``term`` (or a word starting with it), over the whole catalog."""
+    postings = ProductSearchTerm.objects.filter(**term_lookup(term, prefix))
+    if prefix:
+        postings = postings.values('product_id').distinct()
+    return postings.count()
+
+
+def term_postings(term, prefix=False, category_id=None, candidates=None):
+    """``{product_id: weight}`` for one term, limited to ``candidates`` once earlier terms have narrowed them."""
+    postings = ProductSearchTerm.objects.filter(**term_lookup(term, prefix))
+    if category_id is not None and candidates is None:
+        postings = postings.filter(product__category_id=category_id)
+    batches = [None] if candidates is None else [
+        candidates[start:start + CANDIDATE_BATCH_SIZE] for start in range(0, len(candidates), CANDIDATE_BATCH_SIZE)
+    ]
+    docs = defaultdict(int)
+    for batch in batches:
+        rows = postings if batch is None else postings.filter(product_id__in=batch)
+        for product_id, weight in rows.values_list('product_id', 'weight'):
+            docs[product_id] += weight
+    return docs
+
+
+def catalog_size():
+    return cache.get_or_set('search:product-count', Product.objects.count, PRODUCT_COUNT_TIMEOUT) or 1
+
+
+def search_product_ids(query, category_id=None):
+    """
+    Return :class:`RankedIds` for the products matching ``query``.
+
+    Every query term must match. The last one may match as a prefix, so
+    results follow the user while they type, once it has at least
+    MIN_PREFIX_LENGTH characters. ``category_id`` limits the matches to one
+    category. Scores are field-weighted term frequency times inverse
+    document frequency.
+
+    Terms are intersected rarest first: only the rarest term's postings are
+    read in full, and each later term is read for the remaining candidates
+    only. Nothing is truncated before ranking; :class:`RankedIds` then
+    selects just the requested page.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return RankedIds({})
+
+    last = len(terms) - 1
+    frequencies = []
+    for position, term in enumerate(terms):
+        prefix = position == last and len(term) >= MIN_PREFIX_LENGTH
+        frequency = document_frequency(term, prefix)
+        if not frequency:
+            return RankedIds({})
+        frequencies.append((frequency, term, prefix))
+    frequencies.sort(key=lambda entry: entry[0])
+
+    total = catalog_size()
+    scores, candidates = None, None
+    for frequency, term, prefix in frequencies:
+        docs = term_postings(term, prefix, category_id, candidates)
+        if not docs:
+            return RankedIds({})
+        idf = math.log(1 + total / frequency)
+        if scores is None:
+            scores = defaultdict(float)
+        else:
+            scores = defaultdict(float, {pk: scores[pk] for pk in docs})
+        for product_id, weight in docs.items():
+            scores[product_id] += weight * idf
+        candidates = list(scores)
+    return RankedIds(scores)
@@ -1,35 +1,84 @@
 from rest_framework import serializers
-from .models import Product, Category, Order, OrderItem, Review, Payment
+from .models import Product, Category, Order, OrderItem, CartItem, Review, Payment
+from .inventory import InsufficientStock, release_stock, reserve_stock
+from .analytics import record_order
+from .instrumentation import TimedRepresentation
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
 
 User = get_user_model()
 
+def validate_cart(lines):
+    """
+    Check ``(product_id, quantity)`` pairs against the catalog in one query.
+
+    Duplicate lines for the same product are merged. Returns a list of
+    ``{'product': Product, 'quantity': int}`` dicts.
+    """
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+    products = Product.objects.in_bulk(list(quantities))
+    missing = [pk for pk in quantities if pk not in products]
+    if missing:
+        raise serializers.ValidationError(f"Unknown product(s): {', '.join(map(str, missing))}")
+    short = [products[pk].name for pk, qty in quantities.items() if products[pk].stock < qty]
+    if short:
+        raise serializers.ValidationError(f"Not enough stock for: {', '.join(short)}")
+    return [{'product': products[pk], 'quantity': qty} for pk, qty in quantities.items()]
+
+def variant_urls(variants, request=None):
+    """Turn stored ``{variant: {format: path}}`` into absolute URLs."""
+    def url(path):
+        url = default_storage.url(path)
+        return request.build_absolute_uri(url) if request else url
+    return {name: {fmt: url(path) for fmt, path in formats.items()} for name, formats in (variants or {}).items()}
+
 # ==================== PRODUCT ====================
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedRepresentation, serializers.ModelSerializer):
     image = serializers.ImageField(use_url=True)
+    image_variants = serializers.SerializerMethodField()
+    rating_average = serializers.FloatField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj.image_variants, self.context.get('request'))
 
     class Meta:
         model = Product
         fields = '__all__'  # Includes tag_number and other fields automatically
+        read_only_fields = [
+            'rating_count', 'rating_sum',
+            'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+        ]
 
 # ==================== CATEGORY ====================
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedRepresentation, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
 # ==================== ORDER ITEM ====================
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(TimedRepresentation, serializers.ModelSerializer):
+    # A plain ID here lets OrderSerializer load every product in one query
+    product = serializers.IntegerField(source='product_id')
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_image = serializers.ImageField(source='product.image', use_url=True, read_only=True)
     product_price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2, read_only=True)
+    product_image_variants = serializers.SerializerMethodField()
+
+    def get_product_image_variants(self, obj):
+        return variant_urls(obj.product.image_variants, self.context.get('request'))
 
     class Meta:
         model = OrderItem
-        fields = ['product', 'quantity', 'product_name', 'product_image', 'product_price']
+        fields = ['product', 'quantity', 'product_name', 'product_image', 'product_image_variants', 'product_price']
+        extra_kwargs = {'quantity': {'min_value': 1}}
 
 # ==================== ORDER ====================
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedRepresentation, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
     user = serializers.StringRelatedField(read_only=True)  # Optional: include user email in GET
 
@@ -47,16 +96,103 @@ class OrderSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'user']
 
+    def validate_items(self, items):
+        if not items:
+            raise serializers.ValidationError("An order needs at least one item.")
+        return validate_cart((item['product_id'], item['quantity']) for item in items)
+
     def create(self, validated_data):
         request = self.context.get('request', None)
         items_data = validated_data.pop('items')
         user = request.user if request and request.user.is_authenticated else None
 
-        order = Order.objects.create(user=user, **validated_data)
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
+        try:
+            reserved = reserve_stock({item['product'].pk: item['quantity'] for item in items_data})
+        except InsufficientStock as e:
+            raise serializers.ValidationError({'items': [str(e)]})
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(user=user, **validated_data)
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, unit_price=item_data['product'].price, **item_data)
+                    for item_data in items_data
+                ])
+                record_order(order, items_data)
+        except Exception:
+            release_stock(reserved)
+            raise
         return order
 
+# ==================== ORDER SUMMARY ====================
+class OrderSummarySerializer(TimedRepresentation, serializers.ModelSerializer):
+    """Item-free projection of an order for list views."""
+    user_email = serializers.EmailField(source='user.email', read_only=True, default=None)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'customer_name', 'customer_email', 'user_email', 'status', 'created_at']
+        read_only_fields = fields
+
+# ==================== CHECKOUT ====================
+class CheckoutItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class CheckoutSerializer(serializers.Serializer):
+    customer_name = serializers.CharField(max_length=100)
+    customer_email = serializers.EmailField()
+    phone_number = serializers.RegexField(r'^2547\d{8}$', error_messages={
+        'invalid': 'Enter a valid Safaricom number e.g. 254712345678',
+    })
+    shipping_address = serializers.CharField()
+    items = CheckoutItemSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        return validate_cart((item['product'], item['quantity']) for item in items)
+
+# ==================== CART ====================
+class CartItemSerializer(TimedRepresentation, serializers.ModelSerializer):
+    id = serializers.IntegerField(source='product_id', read_only=True)
+    name = serializers.CharField(source='product.name', read_only=True)
+    price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2, read_only=True)
+    image = serializers.ImageField(source='product.image', use_url=True, read_only=True)
+    image_variants = serializers.SerializerMethodField()
+    stock = serializers.IntegerField(source='product.stock', read_only=True)
+    line_total = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj.product.image_variants, self.context.get('request'))
+
+    def get_line_total(self, obj):
+        return f'{obj.product.price * obj.quantity:.2f}'
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'name', 'price', 'image', 'image_variants', 'stock', 'quantity', 'line_total']
+
+class CartAddSerializer(serializers.Serializer):
+    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+class CartQuantitySerializer(serializers.Serializer):
+    quantity = serializers.IntegerField(min_value=0)
+
+class CartReplaceSerializer(serializers.Serializer):
+    items = CheckoutItemSerializer(many=True)
+
+    def to_internal_value(self, data):
+        # Older clients post whole product objects keyed by `id`
+        items = data.get('items', []) if hasattr(data, 'get') else []
+        items = [
+            {'product': item.get('product', item.get('id')), 'quantity': item.get('quantity', 1)}
+            if isinstance(item, dict) else item
+            for item in items
+        ]
+        return super().to_internal_value({'items': items})
+
+    def validate_items(self, items):
+        return validate_cart((item['product'], item['quantity']) for item in items)
+
 # ==================== PASSWORD RESET CUSTOMIZATION ====================
 class CustomPasswordResetSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -73,14 +209,16 @@ class CustomPasswordResetSerializer(serializers.Serializer):
         return self.context.get('user')
 
 # ==================== REVIEW ====================
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedRepresentation, serializers.ModelSerializer):
+    rating = serializers.IntegerField(min_value=1, max_value=5)
+
     class Meta:
         model = Review
         fields = ['id', 'product', 'user', 'rating', 'comment', 'created_at']
         read_only_fields = ['id', 'product', 'user', 'created_at']
 
 # ==================== PAYMENT ====================
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(TimedRepresentation, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
@@ -4,6 +4,12 @@ from djoser.serializers import (
     UserCreateSerializer as BaseUserCreateSerializer,
     UserSerializer as BaseUserSerializer,
 )
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer, TokenVerifySerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from rest_framework_simplejwt.tokens import UntypedToken
+
+from .jwt_auth import CLAIM_FIELDS, ClaimsRefreshToken, check_not_revoked, current_user, revoke_token
 
 User = get_user_model()
 
@@ -47,3 +53,45 @@ class CustomPasswordResetSerializer(serializers.Serializer):
 
     def get_user(self):
         return self._user
+
+
+# JWT mode (JWT_AUTH_ENABLED): token pairs carry user claims, refresh rotates
+class JWTObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return ClaimsRefreshToken.for_user(user)
+
+
+class JWTRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = ClaimsRefreshToken(attrs['refresh'])
+        check_not_revoked(refresh)
+        # Claims come from the user as stored now, never from the presented token
+        user = current_user(refresh)
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            # The presented refresh token is single-use from here on
+            revoke_token(refresh)
+            refresh = ClaimsRefreshToken.for_user(user)
+            return {'access': str(refresh.access_token), 'refresh': str(refresh)}
+
+        access = refresh.access_token
+        for field in CLAIM_FIELDS:
+            access[field] = getattr(user, field)
+        return {'access': str(access)}
+
+
+class JWTVerifySerializer(TokenVerifySerializer):
+    def validate(self, attrs):
+        token = UntypedToken(attrs['token'])
+        check_not_revoked(token)
+        return super().validate(attrs)
+
+
+class JWTLogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate(self, attrs):
+        refresh = ClaimsRefreshToken(attrs['refresh'])
+        revoke_token(refresh)
+        return {}
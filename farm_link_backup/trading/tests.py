@@ -1,3 +1,410 @@
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .aggregations import order_totals, revenue_by_category, top_sellers
+from .images import process_next, variant_files
+from .inventory import InsufficientStock, cancel_order, hold_stock, release_expired_holds, reserve_stock
+from .models import Category, CustomUser, Order, OrderItem, Payment, Product, StockHold
+from .response_cache import invalidate
+
+ORDER_COUNTS = (1, 5, 20)
+
+
+# ==================== QUERY COUNTS ====================
+class OrderListQueryCountTests(TestCase):
+    """Order lists must cost the same number of queries however many orders there are."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='buyer@example.com', username='buyer', password='x')
+        cls.admin = CustomUser.objects.create_superuser(email='admin@example.com', username='admin', password='x')
+        category = Category.objects.create(name='Cattle')
+        cls.products = [
+            Product.objects.create(name=f'Cow {i}', description='d', price='100.00', stock=100, category=category)
+            for i in range(3)
+        ]
+
+    def place_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                user=self.user, customer_name='Buyer', customer_email='buyer@example.com', shipping_address='Farm',
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, unit_price=product.price)
+                for product in self.products
+            ])
+
+    def query_counts(self, user, url, params=None):
+        """Queries for one GET of ``url`` after 1, 5 and 20 orders exist."""
+        client = APIClient()
+        client.force_authenticate(user)
+        counts, placed = [], 0
+        for total in ORDER_COUNTS:
+            self.place_orders(total - placed)
+            placed = total
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        return counts
+
+    def assertConstant(self, counts):
+        self.assertEqual(len(set(counts)), 1, f'query counts for {ORDER_COUNTS} orders: {counts}')
+
+    def test_my_orders(self):
+        self.assertConstant(self.query_counts(self.user, '/my-orders/'))
+
+    def test_admin_orders_summary(self):
+        self.assertConstant(self.query_counts(self.admin, '/api/admin/orders/'))
+
+    def test_admin_orders_full(self):
+        self.assertConstant(self.query_counts(self.admin, '/api/admin/orders/', {'view': 'full'}))
+
+
+# ==================== REPORTS ====================
+class ReportTestData(TestCase):
+    """Orders covering each pricing and status case the reports handle."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user(email='buyer@example.com', username='buyer', password='x')
+        cls.cattle = Category.objects.create(name='Cattle')
+        cls.poultry = Category.objects.create(name='Poultry')
+        cls.cow = Product.objects.create(name='Cow', description='d', price='900.00', stock=50, category=cls.cattle)
+        cls.goat = Product.objects.create(name='Goat', description='d', price='250.00', stock=50, category=cls.cattle)
+        cls.hen = Product.objects.create(name='Hen', description='d', price='12.50', stock=50, category=cls.poultry)
+
+        def order(status='pending', *lines):
+            placed = Order.objects.create(
+                user=user, customer_name='Buyer', customer_email='buyer@example.com',
+                shipping_address='Farm', status=status,
+            )
+            for product, quantity, unit_price in lines:
+                OrderItem.objects.create(order=placed, product=product, quantity=quantity, unit_price=unit_price)
+            return placed
+
+        cls.delivered = order('delivered', (cls.cow, 1, '850.00'), (cls.hen, 4, '12.50'))
+        cls.pending = order('pending', (cls.goat, 2, '240.00'), (cls.hen, 10, '11.00'))
+        # Placed before unit prices were recorded: priced at the product's current price
+        cls.unpriced = order('delivered', (cls.cow, 1, None), (cls.goat, 1, None))
+        # Left out of revenue, still listed with its total
+        cls.cancelled = order('cancelled', (cls.cow, 3, '900.00'), (cls.hen, 1, '12.50'))
+        # No lines: a zero total, and nothing in the revenue reports
+        cls.empty = order('pending')
+
+        cls.start = timezone.now() - timedelta(days=1)
+        cls.end = timezone.now() + timedelta(days=1)
+
+
+class OrmReportTests(ReportTestData):
+    """The ORM versions, used on every backend other than MongoDB."""
+
+    def test_order_totals(self):
+        totals = {order_id: (total, status) for order_id, _, _, total, status in order_totals(native=False)}
+        self.assertEqual(totals, {
+            self.delivered.pk: (Decimal('900.00'), 'delivered'),
+            self.pending.pk: (Decimal('590.00'), 'pending'),
+            self.unpriced.pk: (Decimal('1150.00'), 'delivered'),
+            self.cancelled.pk: (Decimal('2712.50'), 'cancelled'),
+            self.empty.pk: (Decimal('0.00'), 'pending'),
+        })
+        self.assertEqual([row[0] for row in order_totals(status='cancelled', native=False)], [self.cancelled.pk])
+
+    def test_revenue_by_category(self):
+        self.assertEqual(revenue_by_category(self.start, self.end, native=False), [
+            {'category_id': self.cattle.pk, 'category': 'Cattle', 'orders': 3, 'units': 5, 'revenue': Decimal('2480.00')},
+            {'category_id': self.poultry.pk, 'category': 'Poultry', 'orders': 2, 'units': 14, 'revenue': Decimal('160.00')},
+        ])
+        self.assertEqual(revenue_by_category(end=self.start, native=False), [])
+
+    def test_top_sellers(self):
+        self.assertEqual(top_sellers(2, native=False), [
+            {'product_id': self.hen.pk, 'name': 'Hen', 'orders': 2, 'units': 14, 'revenue': Decimal('160.00')},
+            {'product_id': self.goat.pk, 'name': 'Goat', 'orders': 2, 'units': 3, 'revenue': Decimal('730.00')},
+        ])
+
+
+@skipUnless(connection.vendor == 'djongo', 'native pipelines need the djongo (MongoDB) backend')
+class NativePipelineTests(ReportTestData):
+    """Each hand-written pipeline must return exactly what its ORM version does."""
+
+    def assertSameRows(self, report, **kwargs):
+        orm = list(report(native=False, **kwargs))
+        native = list(report(native=True, **kwargs))
+        self.assertTrue(orm)
+        self.assertEqual(native, orm)
+
+    def test_order_totals(self):
+        self.assertSameRows(order_totals)
+        self.assertSameRows(order_totals, status='cancelled')
+
+    def test_order_totals_include_empty_and_cancelled_orders(self):
+        totals = {order_id: total for order_id, _, _, total, _ in order_totals(native=True)}
+        self.assertEqual(totals[self.cancelled.pk], Decimal('2712.50'))
+        self.assertEqual(totals[self.empty.pk], Decimal('0.00'))
+
+    def test_revenue_by_category(self):
+        self.assertSameRows(revenue_by_category)
+        self.assertSameRows(revenue_by_category, start=self.start, end=self.end)
+
+    def test_top_sellers(self):
+        self.assertSameRows(top_sellers)
+        self.assertSameRows(top_sellers, limit=2, start=self.start, end=self.end)
+
+
+# ==================== STOCK RESERVATION ====================
+class StockReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Cattle')
+        cls.cow = Product.objects.create(name='Cow', description='d', price='900.00', stock=3, category=category)
+        cls.goat = Product.objects.create(name='Goat', description='d', price='250.00', stock=1, category=category)
+
+    def stock(self, product):
+        return Product.objects.values_list('stock', flat=True).get(pk=product.pk)
+
+    def test_reservation_never_oversells(self):
+        self.assertEqual(reserve_stock({self.cow.pk: 2}), {self.cow.pk: 2})
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_stock({self.cow.pk: 2})
+        self.assertEqual(raised.exception.product_ids, [self.cow.pk])
+        self.assertEqual(self.stock(self.cow), 1)
+        reserve_stock({self.cow.pk: 1})
+        self.assertEqual(self.stock(self.cow), 0)
+
+    def test_partial_failure_gives_back_what_was_taken(self):
+        with self.assertRaises(InsufficientStock):
+            reserve_stock({self.cow.pk: 2, self.goat.pk: 5})
+        self.assertEqual(self.stock(self.cow), 3)
+        self.assertEqual(self.stock(self.goat), 1)
+
+
+# ==================== STOCK HOLDS ====================
+class StockHoldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='buyer@example.com', username='buyer', password='x')
+        category = Category.objects.create(name='Cattle')
+        cls.cow = Product.objects.create(name='Cow', description='d', price='900.00', stock=5, category=category)
+
+    def held_order(self):
+        order = Order.objects.create(
+            user=self.user, customer_name='Buyer', customer_email='buyer@example.com', shipping_address='Farm',
+        )
+        OrderItem.objects.create(order=order, product=self.cow, quantity=2, unit_price=self.cow.price)
+        Payment.objects.create(user=self.user, order=order, amount='1800.00', status='pending', payment_method='mpesa')
+        hold_stock(order, reserve_stock({self.cow.pk: 2}))
+        return order
+
+    def test_expired_hold_returns_stock(self):
+        order = self.held_order()
+        self.assertEqual(release_expired_holds(), 0)
+        self.assertEqual(Product.objects.get(pk=self.cow.pk).stock, 3)
+
+        self.assertEqual(release_expired_holds(now=timezone.now() + timedelta(days=1)), 1)
+        self.assertEqual(Product.objects.get(pk=self.cow.pk).stock, 5)
+        self.assertEqual(StockHold.objects.get(order=order).status, 'released')
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'cancelled')
+        self.assertEqual(Payment.objects.get(order=order).status, 'expired')
+        # Released once only
+        self.assertEqual(release_expired_holds(now=timezone.now() + timedelta(days=1)), 0)
+        self.assertEqual(Product.objects.get(pk=self.cow.pk).stock, 5)
+
+    @override_settings(MPESA_CALLBACK_SECRET='secret', MPESA_CALLBACK_IPS=[])
+    def test_success_after_admin_cancel_is_flagged_for_refund(self):
+        order = self.held_order()
+        Payment.objects.filter(order=order).update(transaction_id='ws_CO_1')
+        cancel_order(order)
+        self.assertEqual(Payment.objects.get(order=order).status, 'cancelled')
+
+        callback = {'Body': {'stkCallback': {
+            'CheckoutRequestID': 'ws_CO_1',
+            'ResultCode': 0,
+            'CallbackMetadata': {'Item': [{'Name': 'Amount', 'Value': 1800}, {'Name': 'MpesaReceiptNumber', 'Value': 'NLJ7RT61SV'}]},
+        }}}
+        with self.assertLogs('trading.views', 'WARNING'):
+            response = APIClient().post('/api/mpesa/callback/?token=secret', callback, format='json')
+        self.assertEqual(response.status_code, 200)
+        payment = Payment.objects.get(order=order)
+        self.assertEqual((payment.status, payment.receipt_number), ('refund_due', 'NLJ7RT61SV'))
+        # The cancellation stands and the stock stays released
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'cancelled')
+        self.assertEqual(Product.objects.get(pk=self.cow.pk).stock, 5)
+
+
+# ==================== CHECKOUT ====================
+class StubDaraja:
+    def __init__(self):
+        self.pushes = 0
+
+    def stk_push(self, phone_number, amount):
+        self.pushes += 1
+        return {'ResponseCode': '0', 'CheckoutRequestID': f'ws_CO_{self.pushes}'}
+
+
+class IdempotentCheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='buyer@example.com', username='buyer', password='x')
+        category = Category.objects.create(name='Cattle')
+        cls.cow = Product.objects.create(name='Cow', description='d', price='900.00', stock=1, category=category)
+
+    def setUp(self):
+        self.daraja = StubDaraja()
+        patcher = mock.patch('trading.checkout.get_daraja_client', return_value=self.daraja)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def checkout(self, key):
+        return self.client.post('/api/checkout/', {
+            'customer_name': 'Buyer',
+            'customer_email': 'buyer@example.com',
+            'phone_number': '254712345678',
+            'shipping_address': 'Farm',
+            'items': [{'product': self.cow.pk, 'quantity': 1}],
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replayed_key_returns_the_original_order(self):
+        first = self.checkout('key-1')
+        self.assertEqual(first.status_code, 201)
+        # The first request took the last cow; the retry must still get its order back
+        retry = self.checkout('key-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data['order']['id'], first.data['order']['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.cow.pk).stock, 0)
+        self.assertEqual(self.daraja.pushes, 1)
+
+        # A new key is a new order, and the cow is gone
+        self.assertEqual(self.checkout('key-2').status_code, 400)
+
+    def test_key_of_a_cancelled_order_is_gone(self):
+        first = self.checkout('key-1')
+        Order.objects.filter(pk=first.data['order']['id']).update(status='cancelled')
+        retry = self.checkout('key-1')
+        self.assertEqual(retry.status_code, 410)
+        self.assertEqual(retry.data['order_id'], first.data['order']['id'])
+
+
+# ==================== CART ====================
+class PersistentCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='buyer@example.com', username='buyer', password='x')
+        category = Category.objects.create(name='Poultry')
+        cls.hen = Product.objects.create(name='Hen', description='d', price='12.50', stock=10, category=category)
+        cls.duck = Product.objects.create(name='Duck', description='d', price='20.00', stock=2, category=category)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_line_changes_return_fresh_totals(self):
+        added = self.client.post('/api/persistent-cart/items/', {'product': self.hen.pk, 'quantity': 2}, format='json')
+        self.assertEqual(added.status_code, 200)
+        self.assertEqual(added.data['item']['quantity'], 2)
+        self.assertEqual(added.data['subtotal'], '25.00')
+
+        added = self.client.post('/api/persistent-cart/items/', {'product': self.duck.pk}, format='json')
+        self.assertEqual(added.data['subtotal'], '45.00')
+        self.assertEqual(added.data['item_count'], 3)
+
+        changed = self.client.patch(f'/api/persistent-cart/items/{self.hen.pk}/', {'quantity': 4}, format='json')
+        self.assertEqual(changed.data['item']['quantity'], 4)
+        self.assertEqual(changed.data['subtotal'], '70.00')
+
+        short = self.client.patch(f'/api/persistent-cart/items/{self.duck.pk}/', {'quantity': 3}, format='json')
+        self.assertEqual(short.status_code, 409)
+
+        removed = self.client.delete(f'/api/persistent-cart/items/{self.duck.pk}/')
+        self.assertIsNone(removed.data['item'])
+        self.assertEqual(removed.data['subtotal'], '50.00')
+        self.assertEqual(self.client.delete(f'/api/persistent-cart/items/{self.duck.pk}/').status_code, 404)
+
+        self.assertEqual(self.client.get('/api/persistent-cart/').data['total'], '50.00')
+
+    def test_guest_merge_replaces_the_cart_with_the_union(self):
+        self.client.post('/api/persistent-cart/items/', {'product': self.hen.pk, 'quantity': 3}, format='json')
+        # What the storefront posts on login: server lines plus guest lines, larger quantity kept
+        merged = self.client.post('/api/persistent-cart/', {'items': [
+            {'product': self.hen.pk, 'quantity': 3},
+            {'product': self.duck.pk, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(merged.status_code, 200)
+        self.assertEqual({item['id']: item['quantity'] for item in merged.data['items']}, {self.hen.pk: 3, self.duck.pk: 1})
+        self.assertEqual(merged.data['subtotal'], '57.50')
+
+        rejected = self.client.post('/api/persistent-cart/', {'items': [{'product': self.duck.pk, 'quantity': 5}]}, format='json')
+        self.assertEqual(rejected.status_code, 400)
+        self.assertEqual(len(self.client.get('/api/persistent-cart/').data['items']), 2)
+
+
+# ==================== RESPONSE CACHE ====================
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_not_modified_repeats_the_validators(self):
+        first = self.client.get('/categories/')
+        self.assertEqual(first.status_code, 200)
+        revalidated = self.client.get('/categories/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], first['ETag'])
+        self.assertEqual(revalidated['Last-Modified'], first['Last-Modified'])
+        self.assertIn('no-cache', revalidated['Cache-Control'])
+
+    def test_writes_in_the_same_second_change_last_modified(self):
+        first = self.client.get('/categories/')
+        with mock.patch('trading.response_cache.time.time', return_value=2_000_000_000.5):
+            invalidate('categories')
+            modified = self.client.get('/categories/')['Last-Modified']
+            invalidate('categories')
+        second = self.client.get('/categories/', HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+
+# ==================== IMAGE VARIANTS ====================
+class ImageVariantCleanupTests(TransactionTestCase):
+    # File deletion waits for on_commit, which only fires outside TestCase's wrapping transaction
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        category = Category.objects.create(name='Cattle')
+        self.product = Product.objects.create(name='Cow', description='d', price='1.00', stock=1, category=category)
+
+    def upload(self, name, color):
+        buffer = BytesIO()
+        Image.new('RGB', (300, 300), color).save(buffer, 'PNG')
+        product = Product.objects.get(pk=self.product.pk)
+        product.image.save(name, ContentFile(buffer.getvalue()))
+        self.assertTrue(process_next())
+        return variant_files(Product.objects.get(pk=self.product.pk).image_variants)
+
+    def test_replaced_and_deleted_variants_leave_storage(self):
+        first = self.upload('red.png', 'red')
+        self.assertTrue(first and all(default_storage.exists(path) for path in first))
+
+        second = self.upload('blue.png', 'blue')
+        self.assertFalse(any(default_storage.exists(path) for path in first))
+        self.assertTrue(all(default_storage.exists(path) for path in second))
+
+        Product.objects.get(pk=self.product.pk).delete()
+        self.assertFalse(any(default_storage.exists(path) for path in second))
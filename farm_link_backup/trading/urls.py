@@ -5,22 +5,31 @@ from .views import (
     CategoryViewSet,
     PaymentViewSet,  # <-- Add this line
     create_order,
+    checkout_view,
     CartView,
     PersistentCartView,
+    PersistentCartItemsView,
+    PersistentCartItemView,
     test_auth_view,
     stk_push,
     MyOrdersView,  # ✅ Import this
     my_orders_report,
     sales_report,
+    revenue_by_category_report,
+    top_sellers_report,
     inventory_report,
     update_order_status,  # Import the view for updating order status
     product_reviews,
     add_review,
     admin_orders,  # Import the admin_orders view
+    sales_trends_view,
     mpesa_callback,  # Import the M-Pesa callback view
+    JWTCreateView,
+    JWTRefreshView,
+    JWTVerifyView,
+    JWTLogoutView,
 )
 from django.conf import settings
-from django.conf.urls.static import static
 from django.views.generic import TemplateView
 
 router = DefaultRouter()
@@ -34,12 +43,17 @@ urlpatterns = [
     # ✅ Order placement
     path('orders/', create_order, name='create-order'),
 
+    # ✅ One-step checkout (order + payment + STK push)
+    path('api/checkout/', checkout_view, name='checkout'),
+
     # ✅ Order history (new)
     path('my-orders/', MyOrdersView.as_view(), name='my-orders'),
 
     # ✅ Cart endpoints
     path('api/cart/', CartView.as_view(), name='cart'),
     path('api/persistent-cart/', PersistentCartView.as_view(), name='persistent-cart'),
+    path('api/persistent-cart/items/', PersistentCartItemsView.as_view(), name='persistent-cart-items'),
+    path('api/persistent-cart/items/<int:product_id>/', PersistentCartItemView.as_view(), name='persistent-cart-item'),
 
     # ✅ M-Pesa STK Push
     path('api/mpesa/stk-push/', stk_push, name='stk-push'),
@@ -58,6 +72,8 @@ urlpatterns = [
     # ✅ Sales and inventory reports
     path('api/reports/sales/', sales_report, name='sales-report'),
     path('api/reports/inventory/', inventory_report, name='inventory-report'),
+    path('api/reports/revenue-by-category/', revenue_by_category_report, name='revenue-by-category-report'),
+    path('api/reports/top-sellers/', top_sellers_report, name='top-sellers-report'),
 
     # ✅ Update order status
     path('api/orders/<int:order_id>/status/', update_order_status, name='update-order-status'),
@@ -69,10 +85,18 @@ urlpatterns = [
     # ✅ Admin order management
     path('api/admin/orders/', admin_orders, name='admin-orders'),
 
+    # ✅ Analytics (served from pre-aggregated rollups)
+    path('api/analytics/sales-trends/', sales_trends_view, name='sales-trends'),
+
     # ✅ M-Pesa callback
     path('api/mpesa/callback/', mpesa_callback, name='mpesa-callback'),
 ]
 
-# ✅ Serve uploaded media during development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# ✅ Optional JWT endpoints (JWT_AUTH_ENABLED=1)
+if settings.JWT_AUTH_ENABLED:
+    urlpatterns += [
+        path('api/auth/jwt/create/', JWTCreateView.as_view(), name='jwt-create'),
+        path('api/auth/jwt/refresh/', JWTRefreshView.as_view(), name='jwt-refresh'),
+        path('api/auth/jwt/verify/', JWTVerifyView.as_view(), name='jwt-verify'),
+        path('api/auth/jwt/logout/', JWTLogoutView.as_view(), name='jwt-logout'),
+    ]
@@ -1,49 +1,125 @@
 from django.contrib.auth import get_user_model
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+import logging
+from datetime import timedelta
 from decimal import Decimal
-import io
- 
-from .models import Product, Category, Order, UserProfile, Cart, OrderItem, Review, Payment
-from .serializers import ProductSerializer, CategorySerializer, OrderSerializer, ReviewSerializer, PaymentSerializer
-
-import requests
-import base64
-import datetime
-import csv
-from django.http import HttpResponse
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from io import BytesIO
+from rest_framework.exceptions import ValidationError
+
+from .models import Product, Category, Order, OrderItem, Review, Payment
+from .serializers import (
+    ProductSerializer, CategorySerializer, OrderSerializer, OrderSummarySerializer, ReviewSerializer, PaymentSerializer,
+    CheckoutSerializer, CartItemSerializer, CartAddSerializer, CartQuantitySerializer, CartReplaceSerializer,
+)
+from .checkout import CheckoutCancelled, CheckoutInProgress, checkout, previous_checkout
+from .reviews import create_review
+from .analytics import sales_trends
+from .cart import add_item, cart_lines, cart_totals, clear_cart, get_cart, remove_item, replace_cart, set_quantity
+from .inventory import InsufficientStock, cancel_order, commit_hold, reinstate_order, release_hold
+from .filters import AdminOrderFilter, ProductFilter, StableOrderingFilter, parse_datetime_bound, parse_int
+from .pagination import OrderCursorPagination, ProductCursorPagination, ReviewCursorPagination, SearchResultsPagination
+from .search import search_product_ids
+from .related import related_product_ids
+from .reports import REPORT_CHUNK_SIZE, csv_streaming_response, pdf_table_response
+from .aggregations import order_totals, revenue_by_category, top_sellers
+from .daraja import DarajaError, callback_receipt, get_client as get_daraja_client, verify_callback
+from .response_cache import CachedResponseMixin, cached
+from .conditional import conditional, queryset_version, version_validators
+from .serializers_user import JWTLogoutSerializer, JWTObtainPairSerializer, JWTRefreshSerializer, JWTVerifySerializer
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenVerifyView, TokenViewBase
+
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 # ==================== PRODUCTS ====================
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    cache_namespace = 'products'
+    pagination_class = ProductCursorPagination
+    filter_backends = [ProductFilter, StableOrderingFilter]
+    ordering_fields = ['id', 'price', 'name', 'stock']
+    ordering = ['-id']
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'search', 'related']:
             return [AllowAny()]
         return [IsAuthenticated()]
 
+    @action(detail=False, methods=['get'])
+    @cached
+    def search(self, request):
+        params = request.query_params
+        category_id = None
+        if params.get('category'):
+            category_id = parse_int(params['category'], 'category')
+        elif params.get('category_name'):
+            category_id = Category.objects.filter(name__iexact=params['category_name']).values_list('id', flat=True).first()
+            if category_id is None:
+                category_id = 0  # no such category: nothing can match
+        paginator = SearchResultsPagination()
+        page_ids = paginator.paginate_queryset(
+            search_product_ids(params.get('q', ''), category_id=category_id), request, view=self
+        )
+        products = Product.objects.in_bulk(page_ids)
+        serializer = self.get_serializer([products[pk] for pk in page_ids if pk in products], many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    @cached
+    def related(self, request, pk=None):
+        product = self.get_object()
+        try:
+            limit = min(max(int(request.query_params.get('limit', 3)), 1), 20)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        ids = related_product_ids(product, limit, rank=request.query_params.get('rank'))
+        # Stock reservations bypass save(), so sold-out listings are dropped here
+        products = Product.objects.filter(stock__gt=0).in_bulk(ids)
+        serializer = self.get_serializer([products[i] for i in ids if i in products], many=True)
+        return Response(serializer.data)
+
 # ==================== CATEGORIES ====================
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_namespace = 'categories'
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             return [AllowAny()]
         return [IsAuthenticated()]
 
+# ==================== ORDER CONFIRMATION EMAIL ====================
+def send_order_confirmation(order):
+    # Queued; delivered by run_mail_worker
+    try:
+        send_mail(
+            subject="🧾 FarmLink Order Confirmation",
+            message=(
+                f"Hello {order.customer_name},\n\n"
+                f"Your order (ID #{order.id}) has been received successfully. "
+                f"We’ll contact you shortly for delivery.\n\n"
+                f"Thank you for shopping with FarmLink!"
+            ),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[order.customer_email],
+            fail_silently=False,
+        )
+    except Exception:
+        # Only queueing can fail here; delivery failures are retried with backoff by the worker
+        logger.exception("Could not queue the confirmation email for order #%s", order.pk)
+
 # ==================== ORDER CREATION ====================
 @api_view(['POST'])
 def create_order(request):
@@ -56,30 +132,54 @@ def create_order(request):
     if serializer.is_valid():
         order = serializer.save()
 
-        # ✅ Email Confirmation
-        try:
-            send_mail(
-                subject="🧾 FarmLink Order Confirmation",
-                message=(
-                    f"Hello {order.customer_name},\n\n"
-                    f"Your order (ID #{order.id}) has been received successfully. "
-                    f"We’ll contact you shortly for delivery.\n\n"
-                    f"Thank you for shopping with FarmLink!"
-                ),
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[order.customer_email],
-                fail_silently=False,
-            )
-        except Exception as e:
-            print(f"[❌ Email Error] {e}")
+        send_order_confirmation(order)
 
+        order = Order.objects.with_details().get(pk=order.pk)
         return Response({
             "message": "✅ Order placed successfully",
-            "order": serializer.data
+            "order": OrderSerializer(order, context={'request': request}).data
         }, status=status.HTTP_201_CREATED)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# ==================== CHECKOUT ====================
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def checkout_view(request):
+    idempotency_key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+
+    try:
+        # A retry gets its original order back even if that order took the last of the stock
+        previous = previous_checkout(request.user, idempotency_key) if idempotency_key else None
+        if previous is not None:
+            (order, payment, stk_result), created = previous, False
+        else:
+            serializer = CheckoutSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            order, payment, stk_result, created = checkout(request.user, serializer.validated_data, idempotency_key)
+    except CheckoutInProgress:
+        return Response({'error': 'A checkout with this idempotency key is still being processed'},
+                        status=status.HTTP_409_CONFLICT)
+    except CheckoutCancelled as e:
+        return Response({'error': 'Order cancelled; start a new checkout', 'order_id': e.order.pk},
+                        status=status.HTTP_410_GONE)
+    except InsufficientStock as e:
+        return Response({'items': [str(e)]}, status=status.HTTP_409_CONFLICT)
+    if created:
+        send_order_confirmation(order)
+
+    order = Order.objects.with_details().get(pk=order.pk)
+    data = {
+        "order": OrderSerializer(order, context={'request': request}).data,
+        "payment": PaymentSerializer(payment).data if payment else None,
+        "stk": stk_result,
+    }
+    if payment and payment.status == 'failed':
+        data["message"] = "❌ Order saved but the M-Pesa request failed. Retry with the same idempotency key."
+        return Response(data, status=status.HTTP_502_BAD_GATEWAY)
+    data["message"] = "✅ STK Push sent and order submitted!"
+    return Response(data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
 # ==================== GUEST CART ====================
 class CartView(APIView):
     def get(self, request):
@@ -92,18 +192,87 @@ class CartView(APIView):
         return Response({'detail': 'Cart updated', 'items': cart})
 
 # ==================== AUTHENTICATED USER CART ====================
+def cart_response(cart, **extra):
+    # Prices and totals are always computed server-side; money goes out as strings like DecimalField
+    totals = cart_totals(cart)
+    for key in ('subtotal', 'tax', 'total'):
+        totals[key] = str(totals[key])
+    return Response({**extra, **totals})
+
 class PersistentCartView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        return Response({'items': cart.items})
+        cart = get_cart(request.user)
+        items = CartItemSerializer(cart_lines(cart), many=True, context={'request': request}).data
+        return cart_response(cart, items=items)
 
     def post(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        cart.items = request.data.get('items', [])
-        cart.save()
-        return Response({'detail': 'Cart updated', 'items': cart.items})
+        # Whole-cart overwrite, kept for older clients; prefer the per-line endpoints
+        serializer = CartReplaceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart = get_cart(request.user)
+        replace_cart(cart, serializer.validated_data['items'])
+        items = CartItemSerializer(cart_lines(cart), many=True, context={'request': request}).data
+        return cart_response(cart, detail='Cart updated', items=items)
+
+    def delete(self, request):
+        cart = get_cart(request.user)
+        clear_cart(cart)
+        return cart_response(cart, items=[])
+
+class PersistentCartItemsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = CartAddSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart = get_cart(request.user)
+        try:
+            item = add_item(cart, serializer.validated_data['product'], serializer.validated_data['quantity'])
+        except InsufficientStock as e:
+            return Response({'quantity': [str(e)]}, status=status.HTTP_409_CONFLICT)
+        return cart_response(cart, item=CartItemSerializer(item, context={'request': request}).data)
+
+class PersistentCartItemView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def patch(self, request, product_id):
+        serializer = CartQuantitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        product = Product.objects.filter(pk=product_id).first()
+        if product is None:
+            return Response({'detail': 'Product not found.'}, status=status.HTTP_404_NOT_FOUND)
+        cart = get_cart(request.user)
+        try:
+            item = set_quantity(cart, product, serializer.validated_data['quantity'])
+        except InsufficientStock as e:
+            return Response({'quantity': [str(e)]}, status=status.HTTP_409_CONFLICT)
+        data = CartItemSerializer(item, context={'request': request}).data if item else None
+        return cart_response(cart, item=data)
+
+    def delete(self, request, product_id):
+        cart = get_cart(request.user)
+        if not remove_item(cart, product_id):
+            return Response({'detail': 'Not in cart.'}, status=status.HTTP_404_NOT_FOUND)
+        return cart_response(cart, item=None)
+
+# ==================== JWT AUTH ====================
+class JWTCreateView(TokenObtainPairView):
+    serializer_class = JWTObtainPairSerializer
+
+class JWTRefreshView(TokenRefreshView):
+    serializer_class = JWTRefreshSerializer
+
+class JWTVerifyView(TokenVerifyView):
+    serializer_class = JWTVerifySerializer
+
+class JWTLogoutView(TokenViewBase):
+    serializer_class = JWTLogoutSerializer
+
+    def post(self, request, *args, **kwargs):
+        super().post(request, *args, **kwargs)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 # ==================== AUTH TEST VIEW ====================
 @api_view(['GET'])
@@ -118,51 +287,25 @@ def test_auth_view(request):
 @api_view(['POST'])
 def stk_push(request):
     phone = request.data.get('phone')
-    consumer_key = '1DEEHZLVet8rk48sceBOq2KmKfLkvGKwQlE6rhUgk9nxBM24'
-    consumer_secret = '3CM38AMKIlDAWTTsKj9OR4juPJ7xaXQas55Uc1YmNmPnqSWUMvqe4TnkP2cj6mh9'
-    shortcode = '174379'
-    passkey = 'bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919'
-
-    # Generate access token
-    auth_url = 'https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials'
-    r = requests.get(auth_url, auth=(consumer_key, consumer_secret))
-    access_token = r.json().get('access_token')
-
-    # Timestamp & password
-    timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-    password = base64.b64encode((shortcode + passkey + timestamp).encode()).decode()
-
-    # STK Push payload
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json'
-    }
-
-    payload = {
-        "BusinessShortCode": shortcode,
-        "Password": password,
-        "Timestamp": timestamp,
-        "TransactionType": "CustomerPayBillOnline",
-        "Amount": 1,
-        "PartyA": phone,
-        "PartyB": shortcode,
-        "PhoneNumber": phone,
-        "CallBackURL": "https://example.com/api/mpesa/callback/",
-        "AccountReference": "Farmlink",
-        "TransactionDesc": "FarmLink Purchase"
-    }
-
-    stk_url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-    response = requests.post(stk_url, headers=headers, json=payload)
-
-    return Response(response.json())
+    try:
+        result = get_daraja_client().stk_push(phone, amount=1)
+    except DarajaError as e:
+        return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+    return Response(result)
 
 # ==================== ORDER HISTORY (LOGGED-IN USER) ====================
+def my_orders_version(request):
+    # Order rows plus the products they show, since names and prices are embedded
+    orders = Order.objects.filter(user=request.user)
+    products = Product.objects.filter(orderitem__order__user=request.user)
+    return version_validators(request.user.pk, *queryset_version(orders), *queryset_version(products))
+
 class MyOrdersView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(conditional(my_orders_version, private=True))
     def get(self, request):
-        user_orders = Order.objects.filter(user=request.user).order_by('-created_at')
+        user_orders = Order.objects.filter(user=request.user).with_details().order_by('-created_at')
         serializer = OrderSerializer(user_orders, many=True)
         return Response(serializer.data)
 
@@ -170,72 +313,68 @@ class MyOrdersView(APIView):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def my_orders_report(request):
-    user = request.user
-    orders = Order.objects.filter(user=user)
-
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(50, height - 50, "My Orders Report")
-
-    p.setFont("Helvetica", 12)
-    y = height - 90
-    p.drawString(50, y, "Order ID")
-    p.drawString(120, y, "Date")
-    p.drawString(200, y, "Product")
-    p.drawString(350, y, "Qty")
-    p.drawString(400, y, "Price")
-    p.drawString(470, y, "Status")
-    y -= 20
-
-    for order in orders:
-        for item in order.items.all():
-            # Convert Decimal128 to Decimal, then to float
-            price = float(Decimal(str(item.product.price)))
-            total = price * item.quantity
-            p.drawString(50, y, str(order.id))
-            p.drawString(120, y, order.created_at.strftime("%Y-%m-%d"))
-            p.drawString(200, y, item.product.name)
-            p.drawString(350, y, str(item.quantity))
-            p.drawString(400, y, f"{price:.2f}")
-            p.drawString(470, y, getattr(order, 'status', ''))
-            y -= 20
-            if y < 50:
-                p.showPage()
-                y = height - 50
-
-    p.save()
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="my_orders_report.pdf"'
-    return response
+    items = (
+        OrderItem.objects.filter(order__user=request.user)
+        .select_related('order', 'product')
+        .only('quantity', 'order__id', 'order__created_at', 'order__status', 'product__name', 'product__price')
+        .order_by('order_id', 'id')
+        .iterator(chunk_size=REPORT_CHUNK_SIZE)
+    )
+    rows = (
+        [
+            item.order.id,
+            item.order.created_at.strftime("%Y-%m-%d"),
+            item.product.name,
+            item.quantity,
+            # Convert Decimal128 to Decimal before formatting
+            f"{Decimal(str(item.product.price)):.2f}",
+            item.order.status,
+        ]
+        for item in items
+    )
+    columns = [('Order ID', 50), ('Date', 120), ('Product', 200), ('Qty', 350), ('Price', 400), ('Status', 470)]
+    return pdf_table_response('my_orders_report.pdf', columns, rows, title='My Orders Report')
 
 # ==================== ADMIN REPORTS ====================
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def sales_report(request):
-    orders = Order.objects.all()
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="sales_report.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Order ID', 'Date', 'Customer', 'Total', 'Status'])
-    for order in orders:
-        writer.writerow([order.id, order.created_at, getattr(order, 'customer_name', ''), order.total, order.status])
-    return response
+    return csv_streaming_response(
+        'sales_report.csv', ['Order ID', 'Date', 'Customer', 'Total', 'Status'], order_totals()
+    )
+
+def report_range(request):
+    params = request.query_params
+    start = parse_datetime_bound(params['start'], 'start') if params.get('start') else None
+    end = parse_datetime_bound(params['end'], 'end', end_of_day=True) if params.get('end') else None
+    return start, end
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def revenue_by_category_report(request):
+    start, end = report_range(request)
+    rows = revenue_by_category(start, end)
+    return Response([{**row, 'revenue': str(row['revenue'])} for row in rows])
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def top_sellers_report(request):
+    start, end = report_range(request)
+    limit = min(max(parse_int(request.query_params.get('limit', 10), 'limit'), 1), 100)
+    rows = top_sellers(limit, start, end)
+    return Response([{**row, 'revenue': str(row['revenue'])} for row in rows])
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def inventory_report(request):
-    products = Product.objects.all()
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="inventory_report.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Product ID', 'Name', 'Category', 'Stock', 'Price'])
-    for product in products:
-        writer.writerow([product.id, product.name, getattr(product, 'category', ''), product.stock, product.price])
-    return response
+    products = (
+        Product.objects.order_by('id')
+        .values_list('id', 'name', 'category__name', 'stock', 'price')
+        .iterator(chunk_size=REPORT_CHUNK_SIZE)
+    )
+    return csv_streaming_response(
+        'inventory_report.csv', ['Product ID', 'Name', 'Category', 'Stock', 'Price'], products
+    )
 
 @api_view(['PATCH'])
 @permission_classes([IsAdminUser])
@@ -248,8 +387,23 @@ def update_order_status(request, order_id):
     status = request.data.get('status')
     if status not in dict(Order.STATUS_CHOICES):
         return Response({'error': 'Invalid status'}, status=400)
+    # Moving in or out of 'cancelled' also returns or retakes the stock and adjusts the rollups
+    previous = order.status
+    try:
+        with transaction.atomic():
+            if status == 'cancelled' and previous != 'cancelled':
+                changed = cancel_order(order)
+            elif previous == 'cancelled' and status != 'cancelled':
+                changed = reinstate_order(order, status)
+            else:
+                changed = Order.objects.filter(pk=order.pk, status=previous).update(
+                    status=status, updated_at=timezone.now()
+                )
+    except InsufficientStock as e:
+        return Response({'error': str(e)}, status=409)
+    if not changed:
+        return Response({'error': 'Order was changed by another request; try again'}, status=409)
     order.status = status
-    order.save()
     return Response({'message': 'Order status updated', 'order_id': order.id, 'status': order.status})
 
 # ==================== REVIEWS ====================
@@ -259,24 +413,67 @@ def add_review(request, product_id):
     product = Product.objects.get(pk=product_id)
     serializer = ReviewSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save(user=request.user, product=product)
+        if Review.objects.filter(product=product, user=request.user).exists():
+            return Response({'detail': 'You have already reviewed this product.'}, status=status.HTTP_400_BAD_REQUEST)
+        create_review(serializer, request.user, product)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def product_reviews_version(request, product_id):
+    reviews = Review.objects.filter(product_id=product_id)
+    return version_validators(product_id, request.query_params.urlencode(), *queryset_version(reviews, field='created_at'))
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional(product_reviews_version)
 def product_reviews(request, product_id):
     reviews = Review.objects.filter(product_id=product_id)
-    serializer = ReviewSerializer(reviews, many=True)
-    return Response(serializer.data)
+    paginator = ReviewCursorPagination()
+    page = paginator.paginate_queryset(reviews, request)
+    serializer = ReviewSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+# ==================== ANALYTICS ====================
+TREND_DEFAULT_SPAN = {'hour': timedelta(hours=48), 'day': timedelta(days=30), 'month': timedelta(days=365)}
+TREND_MAX_SPAN = {'hour': timedelta(days=62), 'day': timedelta(days=3 * 366), 'month': timedelta(days=20 * 366)}
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def sales_trends_view(request):
+    """Orders, units, revenue and average price per hour/day/month, read from the sales rollups."""
+    params = request.query_params
+    granularity = params.get('granularity', 'day')
+    if granularity not in TREND_DEFAULT_SPAN:
+        raise ValidationError({'granularity': 'Expected hour, day or month.'})
+    end = parse_datetime_bound(params['end'], 'end', end_of_day=True) if params.get('end') else timezone.now()
+    start = parse_datetime_bound(params['start'], 'start') if params.get('start') else end - TREND_DEFAULT_SPAN[granularity]
+    if start >= end:
+        raise ValidationError({'start': 'Must be before end.'})
+    if end - start > TREND_MAX_SPAN[granularity]:
+        raise ValidationError({'start': f'Range too long for {granularity} granularity.'})
+
+    scope, key = 'total', 0
+    if params.get('product'):
+        scope, key = 'product', parse_int(params['product'], 'product')
+    elif params.get('category'):
+        scope, key = 'category', parse_int(params['category'], 'category')
+    return Response(sales_trends(granularity, start, end, scope, key))
 
 # ==================== ADMIN ORDER VIEW ====================
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def admin_orders(request):
-    orders = Order.objects.all().order_by('-created_at')
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    # ?view=full returns orders with their items; the default summary skips them
+    if request.query_params.get('view') == 'full':
+        orders, serializer_class = Order.objects.with_details(), OrderSerializer
+    else:
+        orders, serializer_class = Order.objects.summaries(), OrderSummarySerializer
+    orders = AdminOrderFilter().filter_queryset(request, orders, None)
+
+    paginator = OrderCursorPagination()
+    page = paginator.paginate_queryset(orders, request)
+    serializer = serializer_class(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 # ==================== PAYMENT ====================
 class PaymentViewSet(viewsets.ModelViewSet):
@@ -300,17 +497,39 @@ from .models import Payment
 @api_view(['POST'])
 @permission_classes([AllowAny])  # Safaricom will not be authenticated
 def mpesa_callback(request):
-    # Adjust these keys based on your actual M-Pesa callback payload
-    transaction_id = request.data.get("CheckoutRequestID")
-    result_code = str(request.data.get("ResultCode"))  # "0" means success
+    # Anyone can reach this URL, and a failure callback cancels the order and frees its stock
+    if not verify_callback(request):
+        return Response({"error": "Callback could not be verified"}, status=403)
+
+    # Daraja nests the result under Body.stkCallback; flat payloads are accepted too
+    data = request.data.get("Body", {}).get("stkCallback", request.data)
+    transaction_id = data.get("CheckoutRequestID")
+    result_code = str(data.get("ResultCode"))  # "0" means success
 
     try:
-        payment = Payment.objects.get(transaction_id=transaction_id)
-        if result_code == "0":
-            payment.status = "completed"
-        else:
-            payment.status = "failed"
-        payment.save()
-        return Response({"message": "Payment status updated"}, status=200)
+        payment = Payment.objects.select_related('order').get(transaction_id=transaction_id)
     except Payment.DoesNotExist:
         return Response({"error": "Payment not found"}, status=404)
+
+    # Conditional updates make repeated callbacks no-ops; a payment can still succeed after its hold expired
+    if result_code == "0":
+        receipt = callback_receipt(data)
+        if not Payment.objects.filter(pk=payment.pk, status__in=['pending', 'expired']).update(
+            status='completed', receipt_number=receipt
+        ):
+            # An admin cancelled the order while the customer was paying; the money still arrived
+            if Payment.objects.filter(pk=payment.pk, status='cancelled').update(status='refund_due', receipt_number=receipt):
+                logger.warning(
+                    "Payment %s (receipt %s) succeeded after order %s was cancelled; refund due",
+                    payment.pk, receipt, payment.order_id,
+                )
+                return Response({"message": "Payment recorded for a cancelled order and flagged for refund"}, status=200)
+            return Response({"message": "Payment already processed"}, status=200)
+        if payment.order and not commit_hold(payment.order):
+            return Response({"message": "Payment recorded but stock is no longer available"}, status=200)
+    else:
+        if not Payment.objects.filter(pk=payment.pk, status='pending').update(status='failed'):
+            return Response({"message": "Payment already processed"}, status=200)
+        if payment.order:
+            release_hold(payment.order)
+    return Response({"message": "Payment status updated"}, status=200)
@@ -1,24 +1,48 @@
 import React, { useEffect, useState } from "react";
 import {
   Box, Typography, Table, TableBody, TableCell, TableContainer,
-  TableHead, TableRow, Paper, CircularProgress, Select, MenuItem
+  TableHead, TableRow, Paper, CircularProgress, Select, MenuItem,
+  TextField, Button
 } from "@mui/material";
 import axios from "axios";
 
 export default function AdminOrders() {
   const [orders, setOrders] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [statusFilter, setStatusFilter] = useState("");
+  const [emailFilter, setEmailFilter] = useState("");
 
   const token = localStorage.getItem("token");
 
-  useEffect(() => {
-    axios.get("http://127.0.0.1:8000/api/admin/orders/", {
+  const fetchOrders = (url, params) => {
+    return axios.get(url, {
+      params,
       headers: { Authorization: `Token ${token}` }
-    })
-      .then(res => setOrders(res.data))
+    });
+  };
+
+  useEffect(() => {
+    const params = {};
+    if (statusFilter) params.status = statusFilter;
+    if (emailFilter) params.customer_email = emailFilter;
+    setLoading(true);
+    fetchOrders("http://127.0.0.1:8000/api/admin/orders/", params)
+      .then(res => {
+        setOrders(res.data.results);
+        setNextPage(res.data.next);
+      })
       .catch(() => setOrders([]))
       .finally(() => setLoading(false));
-  }, [token]);
+  }, [token, statusFilter, emailFilter]);
+
+  const loadMore = () => {
+    if (!nextPage) return;
+    fetchOrders(nextPage).then(res => {
+      setOrders(prev => [...prev, ...res.data.results]);
+      setNextPage(res.data.next);
+    });
+  };
 
   const handleStatusChange = (orderId, newStatus) => {
     axios.patch(
@@ -39,6 +63,26 @@ export default function AdminOrders() {
   return (
     <Box p={4}>
       <Typography variant="h5" mb={3}>All Orders</Typography>
+      <Box display="flex" gap={2} mb={2}>
+        <Select
+          value={statusFilter}
+          onChange={e => setStatusFilter(e.target.value)}
+          displayEmpty
+          size="small"
+        >
+          <MenuItem value="">All statuses</MenuItem>
+          <MenuItem value="pending">Pending</MenuItem>
+          <MenuItem value="processing">Processing</MenuItem>
+          <MenuItem value="shipped">Shipped</MenuItem>
+          <MenuItem value="delivered">Delivered</MenuItem>
+          <MenuItem value="cancelled">Cancelled</MenuItem>
+        </Select>
+        <TextField
+          label="Customer email"
+          size="small"
+          onBlur={e => setEmailFilter(e.target.value.trim())}
+        />
+      </Box>
       <TableContainer component={Paper}>
         <Table>
           <TableHead>
@@ -54,7 +98,7 @@ export default function AdminOrders() {
             {orders.map(order => (
               <TableRow key={order.id}>
                 <TableCell>{order.id}</TableCell>
-                <TableCell>{order.user_email || order.user}</TableCell>
+                <TableCell>{order.user_email || order.customer_email}</TableCell>
                 <TableCell>{order.created_at?.slice(0, 10)}</TableCell>
                 <TableCell>
                   <Select
@@ -77,6 +121,11 @@ export default function AdminOrders() {
           </TableBody>
         </Table>
       </TableContainer>
+      {nextPage && (
+        <Box textAlign="center" mt={2}>
+          <Button variant="outlined" onClick={loadMore}>Load More</Button>
+        </Box>
+      )}
     </Box>
   );
 }
\ No newline at end of file
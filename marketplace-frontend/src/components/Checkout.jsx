@@ -1,4 +1,4 @@
-import React, { useState } from "react";
+import React, { useRef, useState } from "react";
 import axios from "axios";
 import { useCart } from "../context/CartContext";
 import Box from "@mui/material/Box";
@@ -23,6 +23,8 @@ export default function Checkout() {
   const [snackbar, setSnackbar] = useState({ open: false, msg: "", severity: "success" });
   const [orderId, setOrderId] = useState(null);
   const [paymentSuccess, setPaymentSuccess] = useState(false);
+  // Reused across retries of the same checkout so the server never creates a duplicate order
+  const idempotencyKey = useRef(null);
 
   const handleChange = (e) => {
     setForm((prev) => ({
@@ -45,78 +47,44 @@ export default function Checkout() {
     setLoading(true);
     try {
       const token = localStorage.getItem("token");
+      if (!idempotencyKey.current) {
+        idempotencyKey.current = crypto.randomUUID();
+      }
 
-      // Step 1: Trigger STK Push
-      const stk = await axios.post(
-        "http://127.0.0.1:8000/api/mpesa/stk-push/",
-        { phone: phone_number },
+      // Order, payment record and STK push in a single request
+      const response = await axios.post(
+        "http://127.0.0.1:8000/api/checkout/",
         {
-          headers: {
-            Authorization: `Token ${token}`,
-          },
-        }
-      );
-
-      if (stk.data.ResponseCode === "0") {
-        // Step 2: Save the order after STK prompt
-        const orderData = {
           ...form,
           items: cart.map((item) => ({
             product: item.id,
             quantity: item.quantity
           }))
-        };
-        const orderResponse = await axios.post(
-          "http://127.0.0.1:8000/orders/",
-          orderData,
-          {
-            headers: {
-              Authorization: `Token ${token}`,
-            },
-          }
-        );
-        // FIX: Get orderId from orderResponse.data.order.id
-        const newOrderId = orderResponse.data.order?.id;
-
-        if (!newOrderId) {
-          throw new Error("Order creation failed: No order ID returned.");
+        },
+        {
+          headers: {
+            Authorization: `Token ${token}`,
+            "Idempotency-Key": idempotencyKey.current,
+          },
         }
+      );
 
-        setOrderId(newOrderId); // Set the new order ID here
-
-        // Step 3: Create the payment record
-        const paymentData = {
-          order: newOrderId,
-          amount: cart.reduce((sum, item) => sum + item.price * item.quantity, 0),
-          status: "pending",
-          transaction_id: stk.data.CheckoutRequestID || "",
-          payment_method: "mpesa",
-        };
-        await axios.post(
-          "http://127.0.0.1:8000/payments/",
-          paymentData,
-          {
-            headers: {
-              Authorization: `Token ${token}`,
-            },
-          }
-        );
-
-        setSnackbar({ open: true, msg: "✅ STK Push sent and order submitted!", severity: "success" });
-        clearCart();
-        localStorage.removeItem("cart");
-        setPaymentSuccess(true); // Set payment success to true
-      } else {
-        setSnackbar({ open: true, msg: "❌ STK Push failed: " + stk.data.errorMessage, severity: "error" });
-      }
+      setOrderId(response.data.order.id);
+      setSnackbar({ open: true, msg: response.data.message, severity: "success" });
+      clearCart();
+      localStorage.removeItem("cart");
+      idempotencyKey.current = null;
+      setPaymentSuccess(true); // Set payment success to true
     } catch (err) {
       // Show real backend error if available
       let msg = "❌ Failed to process order. Try again.";
       if (err.response?.data) {
         msg = typeof err.response.data === "string"
           ? err.response.data
-          : JSON.stringify(err.response.data);
+          : err.response.data.message || JSON.stringify(err.response.data);
       }
+      // The earlier order was cancelled; the next attempt must be a fresh checkout
+      if (err.response?.status === 410) idempotencyKey.current = null;
       setSnackbar({ open: true, msg, severity: "error" });
       console.error("Error during payment or order:", err);
     }
@@ -23,8 +23,17 @@ const Dashboard = () => {
     axios
       .get("http://127.0.0.1:8000/api/analytics/sales-trends/", {
         headers: { Authorization: `Token ${token}` },
+        params: { granularity: "month" },
       })
-      .then((res) => setData(res.data))
+      .then((res) =>
+        setData(
+          res.data.map((row) => ({
+            month: row.period,
+            total_sales: Number(row.revenue),
+            avg_price: row.avg_price === null ? null : Number(row.avg_price),
+          }))
+        )
+      )
       .catch(() => setData([]))
       .finally(() => setLoading(false));
   }, [token]);
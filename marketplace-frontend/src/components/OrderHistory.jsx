@@ -141,7 +141,7 @@ const OrderHistory = () => {
                       <ListItemAvatar>
                         <Avatar
                           variant="rounded"
-                          src={item.product_image}
+                          src={item.product_image_variants?.thumbnail?.jpeg || item.product_image}
                           alt={item.product_name}
                         >
                           {item.product_name ? item.product_name[0] : "?"}
@@ -209,7 +209,7 @@ const OrderHistory = () => {
                             <ListItemAvatar>
                               <Avatar
                                 variant="rounded"
-                                src={item.product_image}
+                                src={item.product_image_variants?.thumbnail?.jpeg || item.product_image}
                                 alt={item.product_name}
                               >
                                 {item.product_name ? item.product_name[0] : "?"}
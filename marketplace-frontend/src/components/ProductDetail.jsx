@@ -2,6 +2,7 @@ import { useEffect, useState } from "react";
 import { useParams, Link } from "react-router-dom";
 import axios from "axios";
 import { useCart } from "../context/CartContext";
+import ProductImage from "./ProductImage";
 import Box from "@mui/material/Box";
 import Typography from "@mui/material/Typography";
 import Button from "@mui/material/Button";
@@ -10,13 +11,12 @@ import Paper from "@mui/material/Paper";
 import Grid from "@mui/material/Grid";
 import Stack from "@mui/material/Stack";
 import Card from "@mui/material/Card";
-import CardMedia from "@mui/material/CardMedia";
 import CardContent from "@mui/material/CardContent";
 import Snackbar from "@mui/material/Snackbar";
 import Alert from "@mui/material/Alert";
 import React from "react";
 
-function ProductReviews({ reviews }) {
+function ProductReviews({ reviews, hasMore, onLoadMore }) {
   return (
     <div>
       <h3>Reviews</h3>
@@ -30,6 +30,11 @@ function ProductReviews({ reviews }) {
           <small>{new Date(r.created_at).toLocaleDateString()}</small>
         </div>
       ))}
+      {hasMore && (
+        <Button size="small" onClick={onLoadMore}>
+          Load more reviews
+        </Button>
+      )}
     </div>
   );
 }
@@ -99,35 +104,46 @@ export default function ProductDetail() {
 
   // Reviews state
   const [reviews, setReviews] = useState([]);
+  const [reviewsNext, setReviewsNext] = useState(null);
   const [reviewsLoading, setReviewsLoading] = useState(true);
 
-  // Fetch reviews
+  // Fetch the newest page of reviews (paginated, newest first)
   const refreshReviews = () => {
     setReviewsLoading(true);
     axios
       .get(`http://127.0.0.1:8000/api/products/${id}/reviews/`)
-      .then((res) => setReviews(res.data))
+      .then((res) => {
+        setReviews(res.data.results);
+        setReviewsNext(res.data.next);
+      })
       .finally(() => setReviewsLoading(false));
   };
 
+  const loadMoreReviews = () => {
+    if (!reviewsNext) return;
+    axios.get(reviewsNext).then((res) => {
+      setReviews((prev) => [...prev, ...res.data.results]);
+      setReviewsNext(res.data.next);
+    });
+  };
+
   useEffect(() => {
     const fetchProduct = async () => {
       try {
         const res = await axios.get(`http://127.0.0.1:8000/products/${id}/`);
         setProduct(res.data);
-        fetchRelated(res.data.category);
+        fetchRelated();
       } catch (err) {
         console.error("Failed to fetch product details", err);
       }
     };
 
-    const fetchRelated = async (category) => {
+    const fetchRelated = async () => {
       try {
-        const res = await axios.get("http://127.0.0.1:8000/products/");
-        const filtered = res.data.filter(
-          (p) => p.category === category && p.id !== parseInt(id)
-        );
-        setRelated(filtered.slice(0, 3)); // Show top 3 related
+        const res = await axios.get(`http://127.0.0.1:8000/products/${id}/related/`, {
+          params: { limit: 3, rank: "co_purchase" },
+        });
+        setRelated(res.data); // Show top 3 related
       } catch (err) {
         console.error("Failed to fetch related products", err);
       }
@@ -171,19 +187,15 @@ export default function ProductDetail() {
         >
           <Grid gridColumn={{ xs: "span 12", md: "span 6" }}>
             {product.image && (
-              <img
+              <ProductImage
+                variant={product.image_variants?.detail}
                 src={
                   product.image?.startsWith('http')
                     ? product.image
                     : `http://127.0.0.1:8000/media/${product.image}`
                 }
                 alt={product.name}
-                style={{
-                  width: "100%",
-                  height: 340,
-                  objectFit: "cover",
-                  borderRadius: 3,
-                }}
+                sx={{ height: 340, borderRadius: 3 }}
               />
             )}
           </Grid>
@@ -192,6 +204,12 @@ export default function ProductDetail() {
               <Typography variant="h4" fontWeight={700}>
                 {product.name}
               </Typography>
+              {product.rating_count > 0 && (
+                <Typography variant="body1" color="text.secondary">
+                  ★ {product.rating_average.toFixed(1)} from {product.rating_count} review
+                  {product.rating_count === 1 ? "" : "s"}
+                </Typography>
+              )}
               {product.tag_number && (
                 <Typography
                   variant="body2"
@@ -302,21 +320,16 @@ export default function ProductDetail() {
                 }}
               >
                 {item.image && (
-                  <CardMedia
-                    component="img"
-                    height="200"
-                    image={
+                  <ProductImage
+                    variant={item.image_variants?.card}
+                    src={
                       item.image?.startsWith('http')
                         ? item.image
                         : `http://127.0.0.1:8000/media/${item.image}`
                     }
                     alt={item.name}
-                    onError={(e) => {
-                      e.target.src = '/placeholder.jpg';
-                    }}
                     sx={{
                       height: 140,
-                      objectFit: "cover",
                       borderTopLeftRadius: 3,
                       borderTopRightRadius: 3,
                     }}
@@ -342,7 +355,7 @@ export default function ProductDetail() {
       {reviewsLoading ? (
         <Typography>Loading reviews...</Typography>
       ) : (
-        <ProductReviews reviews={reviews} />
+        <ProductReviews reviews={reviews} hasMore={Boolean(reviewsNext)} onLoadMore={loadMoreReviews} />
       )}
       {product && (
         <AddReview productId={product.id} onReviewAdded={refreshReviews} />
@@ -0,0 +1,26 @@
+import React from 'react';
+import Box from '@mui/material/Box';
+
+// Renders one size of a product's image variants. Browsers that support WebP
+// pick the <source>; the rest load the JPEG, or the original upload while the
+// variants are still being built.
+const ProductImage = ({ variant, src, alt, sx }) => (
+  <picture style={{ display: 'block' }}>
+    {variant?.webp && <source srcSet={variant.webp} type="image/webp" />}
+    <Box
+      component="img"
+      src={variant?.jpeg || src}
+      alt={alt}
+      onError={(e) => {
+        // A <source> wins over the img's src, so drop it before falling back
+        e.target.parentNode.querySelectorAll('source').forEach((source) => source.remove());
+        if (!e.target.src.endsWith('/placeholder.jpg')) {
+          e.target.src = '/placeholder.jpg';
+        }
+      }}
+      sx={{ display: 'block', width: '100%', objectFit: 'cover', ...sx }}
+    />
+  </picture>
+);
+
+export default ProductImage;
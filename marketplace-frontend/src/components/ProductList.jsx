@@ -5,7 +5,6 @@ import {
   TextField,
   Grid,
   Card,
-  CardMedia,
   CardContent,
   Typography,
   Box,
@@ -24,9 +23,11 @@ import {
 import SearchIcon from '@mui/icons-material/Search';
 import CloseIcon from '@mui/icons-material/Close';
 import { useCart } from '../context/CartContext';
+import ProductImage from './ProductImage';
 
 const ProductList = () => {
   const [products, setProducts] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [search, setSearch] = useState('');
   const [filteredProducts, setFilteredProducts] = useState([]);
   const [selectedCategory, setSelectedCategory] = useState('All');
@@ -36,46 +37,42 @@ const ProductList = () => {
   const { addToCart } = useCart();
   const navigate = useNavigate();
 
+  // Category filtering and paging happen on the server; each page is a cursor
   useEffect(() => {
-    axios.get('http://127.0.0.1:8000/products/')
+    const params = selectedCategory !== 'All' ? { category_name: selectedCategory } : {};
+    axios.get('http://127.0.0.1:8000/products/', { params })
       .then(res => {
-        setProducts(res.data);
-        setFilteredProducts(res.data);
+        setProducts(res.data.results);
+        setNextPage(res.data.next);
       })
       .catch(err => console.log(err));
-  }, []);
+  }, [selectedCategory]);
 
-  useEffect(() => {
-    let updated = products;
-
-    // Category filter: match if product name or category matches selectedCategory
-    if (selectedCategory && selectedCategory !== 'All') {
-      updated = updated.filter(product => {
-        const catName = typeof product.category === 'string'
-          ? product.category
-          : product.category?.name;
-        // Match if product name or category matches selectedCategory (case-insensitive)
-        return (
-          (catName && catName.toLowerCase() === selectedCategory.toLowerCase()) ||
-          (product.name && product.name.toLowerCase().includes(selectedCategory.toLowerCase()))
-        );
-      });
-    }
+  const loadMore = () => {
+    if (!nextPage) return;
+    axios.get(nextPage)
+      .then(res => {
+        setProducts(prev => [...prev, ...res.data.results]);
+        setNextPage(res.data.next);
+      })
+      .catch(err => console.log(err));
+  };
 
-    // Search filter: match if name, description, or category contains search text
-    if (search.trim() !== '') {
-      updated = updated.filter(product =>
-        product.name.toLowerCase().includes(search.toLowerCase()) ||
-        product.description?.toLowerCase().includes(search.toLowerCase()) ||
-        (typeof product.category === 'string'
-          ? product.category
-          : product.category?.name
-        )?.toLowerCase().includes(search.toLowerCase())
-      );
+  // Search runs against the server-side index; the catalog page is shown otherwise
+  useEffect(() => {
+    if (search.trim() === '') {
+      setFilteredProducts(products);
+      return;
     }
-
-    setFilteredProducts(updated);
-  }, [search, selectedCategory, products]);
+    const timer = setTimeout(() => {
+      const params = { q: search };
+      if (selectedCategory !== 'All') params.category_name = selectedCategory;
+      axios.get('http://127.0.0.1:8000/products/search/', { params })
+        .then(res => setFilteredProducts(res.data.results))
+        .catch(err => console.log(err));
+    }, 300);
+    return () => clearTimeout(timer);
+  }, [search, products, selectedCategory]);
 
   // Handler for Add to Cart
   const handleAddToCart = (product) => {
@@ -181,10 +178,9 @@ const ProductList = () => {
                   }}
                 >
                   <Link to={`/products/${product.id}`} style={{ textDecoration: 'none', color: 'inherit' }}>
-                    <CardMedia
-                      component="img"
-                      height="200"
-                      image={
+                    <ProductImage
+                      variant={product.image_variants?.card}
+                      src={
                         product.image
                           ? (product.image.startsWith('http')
                               ? product.image
@@ -192,9 +188,7 @@ const ProductList = () => {
                           : '/placeholder.jpg'
                       }
                       alt={product.name}
-                      onError={(e) => {
-                        e.target.src = '/placeholder.jpg';
-                      }}
+                      sx={{ height: 200 }}
                     />
                   </Link>
                   <CardContent sx={{ flexGrow: 1 }}>
@@ -205,6 +199,11 @@ const ProductList = () => {
                         maximumFractionDigits: 2
                       })}
                     </Typography>
+                    {product.rating_count > 0 && (
+                      <Typography variant="body2" color="text.secondary">
+                        ★ {product.rating_average.toFixed(1)} ({product.rating_count})
+                      </Typography>
+                    )}
                   </CardContent>
                   <Box sx={{ display: 'flex', justifyContent: 'space-between', p: 2, pt: 0 }}>
                     <Button
@@ -250,6 +249,11 @@ const ProductList = () => {
             </Grid>
           )}
         </Grid>
+        {nextPage && search.trim() === '' && (
+          <Box sx={{ textAlign: 'center', mt: 3 }}>
+            <Button variant="outlined" onClick={loadMore}>Load More</Button>
+          </Box>
+        )}
         <Snackbar
           open={snackbar.open}
           autoHideDuration={2000}
@@ -27,6 +27,7 @@ export default function SellerCenter() {
   const [loading, setLoading] = useState(false);
   const [categories, setCategories] = useState([]);
   const [myListings, setMyListings] = useState([]);
+  const [nextListings, setNextListings] = useState(null);
 
   // Fetch categories on mount
   useEffect(() => {
@@ -35,15 +36,22 @@ export default function SellerCenter() {
       .catch(() => setCategories([]));
   }, []);
 
-  // Fetch user's listings on mount and after submit
-  const fetchMyListings = () => {
+  // Fetch user's listings on mount and after submit; further pages follow the cursor
+  const fetchMyListings = (url = "http://127.0.0.1:8000/products/") => {
     const token = localStorage.getItem("token");
     if (!token) return;
-    axios.get("http://127.0.0.1:8000/products/", {
+    const firstPage = !url.includes("cursor=");
+    axios.get(url, {
       headers: { Authorization: `Token ${token}` }
     })
-      .then(res => setMyListings(res.data))
-      .catch(() => setMyListings([]));
+      .then(res => {
+        setMyListings(prev => (firstPage ? res.data.results : [...prev, ...res.data.results]));
+        setNextListings(res.data.next);
+      })
+      .catch(() => {
+        if (firstPage) setMyListings([]);
+        setNextListings(null);
+      });
   };
   useEffect(() => { fetchMyListings(); }, []);
 
@@ -304,6 +312,11 @@ export default function SellerCenter() {
                   </Box>
                 </Paper>
               ))}
+              {nextListings && (
+                <Box textAlign="center">
+                  <Button variant="outlined" onClick={() => fetchMyListings(nextListings)}>Load More</Button>
+                </Box>
+              )}
             </Box>
           )}
         </Box>
@@ -16,12 +16,14 @@ export default function VetDashboard() {
   const [animals, setAnimals] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState("");
+  const [nextPage, setNextPage] = useState(null);
 
   useEffect(() => {
     const fetchAnimals = async () => {
       try {
         const res = await axios.get("http://127.0.0.1:8000/products/");
-        setAnimals(res.data);
+        setAnimals(res.data.results);
+        setNextPage(res.data.next);
       } catch (err) {
         setError("Failed to fetch animal records");
       } finally {
@@ -31,6 +33,18 @@ export default function VetDashboard() {
     fetchAnimals();
   }, []);
 
+  // Records arrive a cursor page at a time
+  const loadMore = async () => {
+    if (!nextPage) return;
+    try {
+      const res = await axios.get(nextPage);
+      setAnimals((prev) => [...prev, ...res.data.results]);
+      setNextPage(res.data.next);
+    } catch (err) {
+      setError("Failed to fetch animal records");
+    }
+  };
+
   return (
     <Box p={4} maxWidth={1100} mx="auto">
       <Typography variant="h4" fontWeight="bold" mb={3} color="#f68b1e">
@@ -100,6 +114,13 @@ export default function VetDashboard() {
           </Table>
         </TableContainer>
       )}
+      {!loading && !error && nextPage && (
+        <Box textAlign="center" mt={3}>
+          <Button variant="outlined" onClick={loadMore}>
+            Load More
+          </Button>
+        </Box>
+      )}
     </Box>
   );
 }
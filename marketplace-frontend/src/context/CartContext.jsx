@@ -1,11 +1,30 @@
-import React, { createContext, useContext, useEffect, useState, useCallback, useRef } from "react";
+import React, { createContext, useContext, useEffect, useState, useCallback } from "react";
 import axios from "axios";
 
 const CartContext = createContext();
 
+const CART_API = "http://127.0.0.1:8000/api/persistent-cart/";
+
 export const useCart = () => useContext(CartContext);
 
+// Guests keep their cart in localStorage, so totals are worked out here
+const localTotals = (items) => {
+  const subtotal = items.reduce((sum, i) => sum + Number(i.price || 0) * (i.quantity || 1), 0);
+  return { subtotal, tax: 0, total: subtotal };
+};
+
+// Union of the server cart and the guest cart; a product in both keeps the larger
+// quantity, so a guest cart that was copied from the server isn't counted twice
+const mergeLines = (serverItems, guestItems) => {
+  const quantities = new Map(serverItems.map((i) => [i.id, i.quantity || 1]));
+  guestItems.forEach((i) => {
+    quantities.set(i.id, Math.max(quantities.get(i.id) || 0, i.quantity || 1));
+  });
+  return [...quantities].map(([product, quantity]) => ({ product, quantity }));
+};
+
 export const CartProvider = ({ children, user }) => {
+  const token = user?.token || localStorage.getItem("token");
   const [cart, setCart] = useState(() => {
     const storedCart = localStorage.getItem("cart");
     return storedCart ? JSON.parse(storedCart) : [];
@@ -15,71 +34,89 @@ export const CartProvider = ({ children, user }) => {
   const [total, setTotal] = useState(0);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
-  const saveTimeout = useRef(null);
 
-  // Fetch cart from backend on mount or when user changes
+  const authHeaders = useCallback(
+    () => ({ headers: { Authorization: `Token ${token}` } }),
+    [token]
+  );
+
+  const applyTotals = (data) => {
+    setSubtotal(Number(data.subtotal) || 0);
+    setTax(Number(data.tax) || 0);
+    setTotal(Number(data.total) || 0);
+  };
+
+  const storeCart = (items) => {
+    setCart(items);
+    localStorage.setItem("cart", JSON.stringify(items));
+    // Remember whether these lines were picked as a guest, so signing in can merge them
+    localStorage.setItem("cartOwner", token ? "user" : "guest");
+    if (!token) applyTotals(localTotals(items));
+  };
+
+  const adoptServerCart = (data) => {
+    storeCart(Array.isArray(data.items) ? data.items : []);
+    applyTotals(data);
+  };
+
+  // Fetch cart from backend on mount or when the signed-in user changes.
+  // Lines added as a guest are merged into the server cart before it is adopted.
   useEffect(() => {
-    if (!user) {
-      setCart([]);
-      setSubtotal(0);
-      setTax(0);
-      setTotal(0);
+    if (!token) {
+      applyTotals(localTotals(cart));
       return;
     }
+    const guestItems = localStorage.getItem("cartOwner") !== "user" ? cart : [];
     setLoading(true);
     setError(null);
     axios
-      .get(`/api/cart/`, { headers: { Authorization: `Token ${user.token}` } })
+      .get(CART_API, authHeaders())
       .then((res) => {
-        if (res.data && Array.isArray(res.data.items)) {
-          setCart(res.data.items);
-          setSubtotal(res.data.subtotal || 0);
-          setTax(res.data.tax || 0);
-          setTotal(res.data.total || 0);
-        } else {
-          setCart([]);
-          setSubtotal(0);
-          setTax(0);
-          setTotal(0);
+        if (guestItems.length === 0) {
+          adoptServerCart(res.data);
+          return;
         }
+        const serverItems = Array.isArray(res.data.items) ? res.data.items : [];
+        return axios
+          .post(CART_API, { items: mergeLines(serverItems, guestItems) }, authHeaders())
+          .then((merged) => adoptServerCart(merged.data))
+          .catch((err) => {
+            adoptServerCart(res.data);
+            const data = err.response?.data;
+            setError(data?.items?.[0] || "Items from your guest cart could not be added.");
+          });
       })
-      .catch((err) => {
-        setError("Failed to fetch cart.");
-        setCart([]);
-        setSubtotal(0);
-        setTax(0);
-        setTotal(0);
-      })
+      .catch(() => setError("Failed to fetch cart."))
       .finally(() => setLoading(false));
-  }, [user]);
-
-  // Debounced save to backend
-  const saveCartToBackend = useCallback(
-    (newCart) => {
-      if (!user) return;
-      if (saveTimeout.current) clearTimeout(saveTimeout.current);
-      saveTimeout.current = setTimeout(() => {
-        axios
-          .post(
-            `/api/cart/save/`,
-            { cart: newCart },
-            { headers: { Authorization: `Token ${user.token}` } }
-          )
-          .catch(() => setError("Failed to save cart."));
-      }, 500); // 500ms debounce
-    },
-    [user]
-  );
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [token]);
 
-  // Update cart and trigger debounced save
-  const updateCart = (newCart) => {
-    if (!Array.isArray(newCart)) {
-      setError("Cart data is invalid.");
-      return;
-    }
-    setCart(newCart);
-    saveCartToBackend(newCart);
-    localStorage.setItem("cart", JSON.stringify(newCart));
+  // Apply a change locally right away, then send only that change to the server.
+  // The server answers with the changed line and fresh totals; on failure we roll back.
+  const mutate = (optimistic, request, productId) => {
+    const previous = cart;
+    storeCart(optimistic);
+    if (!token) return;
+    request()
+      .then((res) => {
+        const item = res.data.item;
+        if (productId !== undefined) {
+          // Merge into the latest state so quick successive clicks aren't lost
+          setCart((current) => {
+            const next = item
+              ? current.map((i) => (i.id === productId ? { ...item, quantity: i.quantity } : i))
+              : current.filter((i) => i.id !== productId);
+            localStorage.setItem("cart", JSON.stringify(next));
+            return next;
+          });
+        }
+        applyTotals(res.data);
+      })
+      .catch((err) => {
+        storeCart(previous);
+        const data = err.response?.data;
+        setError(data?.quantity?.[0] || data?.detail || "Failed to update cart.");
+      });
   };
 
   // Add item to cart
@@ -89,15 +126,14 @@ export const CartProvider = ({ children, user }) => {
       return;
     }
     const exists = cart.find((i) => i.id === item.id);
-    let newCart;
-    if (exists) {
-      newCart = cart.map((i) =>
-        i.id === item.id ? { ...i, quantity: (i.quantity || 1) + 1 } : i
-      );
-    } else {
-      newCart = [...cart, { ...item, quantity: 1 }];
-    }
-    updateCart(newCart);
+    const newCart = exists
+      ? cart.map((i) => (i.id === item.id ? { ...i, quantity: (i.quantity || 1) + 1 } : i))
+      : [...cart, { id: item.id, name: item.name, price: item.price, image: item.image, quantity: 1 }];
+    mutate(
+      newCart,
+      () => axios.post(`${CART_API}items/`, { product: item.id, quantity: 1 }, authHeaders()),
+      item.id
+    );
   };
 
   // Remove item from cart
@@ -106,30 +142,27 @@ export const CartProvider = ({ children, user }) => {
       setError("Invalid item ID.");
       return;
     }
-    const newCart = cart.filter((i) => i.id !== itemId);
-    updateCart(newCart);
+    mutate(
+      cart.filter((i) => i.id !== itemId),
+      () => axios.delete(`${CART_API}items/${itemId}/`, authHeaders()),
+      itemId
+    );
   };
 
   // Clear cart
   const clearCart = () => {
-    updateCart([]);
+    mutate([], () => axios.delete(CART_API, authHeaders()));
   };
 
   // ✅ Update quantity of specific item
   const updateQuantity = (id, newQty) => {
-    const newCart = cart.map((item) =>
-      item.id === id ? { ...item, quantity: newQty } : item
+    mutate(
+      cart.map((item) => (item.id === id ? { ...item, quantity: newQty } : item)),
+      () => axios.patch(`${CART_API}items/${id}/`, { quantity: newQty }, authHeaders()),
+      id
     );
-    updateCart(newCart);
   };
 
-  // Cleanup debounce timer on unmount
-  useEffect(() => {
-    return () => {
-      if (saveTimeout.current) clearTimeout(saveTimeout.current);
-    };
-  }, []);
-
   return (
     <CartContext.Provider
       value={{